@@ -1,15 +1,18 @@
 import os
 import os.path
-import re
 from datetime import datetime
 from flask import Flask, send_from_directory
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_migrate import Migrate
-from markupsafe import escape, Markup
+from markupsafe import Markup
+from .markup import render_markdown
 
 
-def markdown_format(s: str) -> str:
-    return Markup('<br><br>'.join(re.split(r'(?:\r\n|\r|\n){2}', escape(s))))
+def markdown_format(s: str | None, html: str | None = None) -> Markup:
+    """Returns the HTML stored with the text, or renders it."""
+    if html is None:
+        html = render_markdown(s)
+    return Markup(html or '')
 
 
 def wtforms_error_class(field):
@@ -31,7 +34,7 @@ def serve_well_known(name: str):
         os.path.dirname(__file__), 'well-known'), name)
 
 
-def create_app():
+def create_app(test_config: dict | None = None):
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_mapping(
         SECRET_KEY='sdfsdfsdf',
@@ -39,22 +42,64 @@ def create_app():
         OAUTH_ID='',
         OAUTH_SECRET='',
         PROXY=False,
+        X_ACCEL_REDIRECT='',
         MAX_UPLOAD_SIZE_MB=25,
         MAX_ICON_SIZE_KB=100,
+        MAX_UNPACKED_SIZE_MB=100,
+        MAX_UNPACKED_FILE_MB=50,
+        MAX_COMPRESSION_RATIO=100,
+        CATALOG_TTL=300,
+        API_COMPRESSION=True,
+        DOWNLOAD_FLUSH_INTERVAL=10,
+        DOWNLOAD_FLUSH_SIZE=100,
+        DOWNLOAD_SPOOL=False,
+        METRICS=True,
+        BACKGROUND_JOBS=False,
+        SQLITE_PRODUCTION=True,
+        USER_CACHE_TTL=300,
+        STORAGE='local',
+        S3_BUCKET='',
+        S3_PREFIX='',
+        S3_ENDPOINT_URL='',
+        S3_REGION='',
+        DOWNLOAD_URL_EXPIRES=300,
     )
-    app.config.from_pyfile('config.py', silent=True)
+    if test_config is None:
+        app.config.from_pyfile('config.py', silent=True)
+    else:
+        app.config.from_mapping(test_config)
     app.config['MAX_CONTENT_LENGTH'] = (
         app.config['MAX_UPLOAD_SIZE_MB'] * 1024 * 1024)
     os.makedirs(app.instance_path, exist_ok=True)
 
     from .database import db
+    from . import sqlite
+    sqlite.set_engine_options(app)
     db.init_app(app)
+    sqlite.init_app(app)
     Migrate(app, db)
     app.add_template_filter(markdown_format, 'markdown')
     app.add_template_filter(wtforms_error_class, 'fc')
     app.add_template_filter(date_ago, 'ago')
+    from .icons import icon_url
+    app.add_template_global(icon_url, 'icon_url')
+    from .fragments import fragment
+    app.add_template_global(fragment, 'fragment')
     app.add_url_rule('/.well-known/<name>', view_func=serve_well_known)
 
+    from . import downloads
+    downloads.init_app(app)
+    from . import metrics
+    metrics.init_app(app)
+    from . import search
+    search.init_app(app)
+    from . import jobs
+    jobs.init_app(app)
+    from . import markup
+    markup.init_app(app)
+    from . import storage
+    storage.init_app(app)
+
     from . import plugins
     app.register_blueprint(plugins.bp)
     from . import api
@@ -64,7 +109,7 @@ def create_app():
     app.register_blueprint(auth.bp)
 
     if app.config['PROXY']:
-        app.wsgi_app = ProxyFix(
+        app.wsgi_app = ProxyFix(  # type: ignore[method-assign]
             app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 
     return app
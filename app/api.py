@@ -1,14 +1,27 @@
-from flask import Blueprint, url_for, request
+from flask import Blueprint, url_for, request, current_app, abort
 from typing import Any
-from sqlalchemy import or_
-from .database import db, Plugin
+from sqlalchemy import or_, func, sql
+from sqlalchemy.orm import selectinload
+from .database import (
+    db, Plugin, PluginVersion, PluginChange, plugins_page,
+)
+from . import catalog, search as search_index
+from .icons import icon_url
+from .encoding import encode_response
+from .conditional import (
+    conditional, plugin_validator, not_modified, set_validators,
+)
 
 
 bp = Blueprint('api', __name__)
+bp.after_request(encode_response)
+MAX_UPDATE_CHECKS = 500
 
 
 def plugin_to_dict(plugin: Plugin, experimental=False,
                    version: int | None = None):
+    """With the installed version, which must be stored by digest, see
+    stored_versions(), adds a link to the delta update from it."""
     result: dict[str, Any] = {
         'id': plugin.id,
         'name': plugin.title,
@@ -27,8 +40,7 @@ def plugin_to_dict(plugin: Plugin, experimental=False,
         result['hidden'] = True
 
     if plugin.icon:
-        result['icon'] = url_for(
-            'plugins.icon', name=plugin.id, ext=plugin.icon, _external=True)
+        result['icon'] = icon_url(plugin, external=True)
 
     result['downloads'] = plugin.downloads
 
@@ -37,31 +49,175 @@ def plugin_to_dict(plugin: Plugin, experimental=False,
         result['version'] = vobj.version_str
         result['updated'] = vobj.created_on.isoformat(' ')
         result['experimental'] = vobj.experimental
+        if vobj.sha256:
+            result['sha256'] = vobj.sha256
         result['download'] = url_for(
-            'plugins.download', name=plugin.id, version=vobj.version,
+            'plugins.download', name=plugin.id, version=vobj.version_str,
             _external=True)
+        if version and version < vobj.version and vobj.sha256:
+            result['delta'] = url_for(
+                'plugins.download_delta', name=plugin.id,
+                from_version=PluginVersion.format_version(version),
+                version=vobj.version_str, _external=True)
     else:
         return None
     return result
 
 
+def stored_versions(installed: dict[str, int]) -> set[tuple[str, int]]:
+    """Returns (plugin id, version) pairs that have packages stored by
+    digest, so deltas from them can be made."""
+    pairs = {(k, v) for k, v in installed.items() if v > 0}
+    if not pairs:
+        return set()
+    # SQLite does not use indexes for (a, b) IN (...), so this selects
+    # a few extra rows and filters them here.
+    found = db.session.execute(
+        db.select(PluginVersion.plugin_id, PluginVersion.version)
+        .where(PluginVersion.plugin_id.in_({k for k, _ in pairs}))
+        .where(PluginVersion.version.in_({v for _, v in pairs}))
+        .where(PluginVersion.sha256.is_not(None))
+    ).tuples()
+    return pairs & set(found)
+
+
+def filter_visible(q, countries: list[str]):
+    q = q.where(Plugin.hidden == sql.false())
+    if countries:
+        return q.where(or_(Plugin.country.is_(None),
+                           Plugin.country.in_(countries)))
+    return q.where(Plugin.country.is_(None))
+
+
 @bp.route('/list', endpoint='list')
 def list_plugins():
     countries = [c for c in request.args.get('countries', '').split(',') if c]
-    q = db.select(Plugin).where(~Plugin.hidden)
-    if countries:
-        q = q.where(or_(Plugin.country.is_(None),
-                        Plugin.country.in_(countries)))
-    else:
-        q = q.where(Plugin.country.is_(None))
+    exp = request.args.get('exp') == '1'
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    latest = Plugin.last_eversion_pk if exp else Plugin.last_version_pk
+    q = filter_visible(db.select(Plugin), countries).where(
+        latest.is_not(None)).options(selectinload(Plugin.created_by))
+
+    def build():
+        if not limit:
+            plugins = db.session.scalars(q.order_by(Plugin.title))
+            return [plugin_to_dict(p, exp) for p in plugins]
+        try:
+            plugins, next_cursor = plugins_page(
+                q, cursor, max(1, min(limit, 500)))
+        except ValueError as e:
+            abort(400, str(e))
+        return {
+            'plugins': [plugin_to_dict(p, exp) for p in plugins],
+            'next': next_cursor,
+        }
+
+    key = (frozenset(countries), exp, limit, cursor)
+    etag = catalog.cached_etag(key)
+    if etag and (resp := not_modified(etag, personal=False)):
+        return resp
+    data, etag = catalog.get_snapshot(key, build)
+    resp = current_app.response_class(data, mimetype='application/json')
+    set_validators(resp, etag, personal=False)
+    return resp
+
 
-    plugins = db.session.scalars(q.order_by(Plugin.title))
+@bp.route('/search')
+def search():
+    value = request.args.get('q', '').strip()
+    countries = [c for c in request.args.get('countries', '').split(',') if c]
     exp = request.args.get('exp') == '1'
+    page = request.args.get('page', 1, type=int)
+    limit = max(1, min(request.args.get('limit', 50, type=int), 100))
+    latest = Plugin.last_eversion_pk if exp else Plugin.last_version_pk
+    plugins, _ = search_index.search(
+        value, page, limit,
+        lambda q: filter_visible(q, countries).where(latest.is_not(None))
+        .options(selectinload(Plugin.created_by)))
     result = (plugin_to_dict(p, exp) for p in plugins)
     return [r for r in result if r]
 
 
+@bp.route('/changes')
+def changes():
+    """Returns plugins changed since the token, and a new token.
+    Plugins that were deleted or hidden, or no longer match the filters,
+    are returned as {'id': ..., 'deleted': true}. With no token or zero,
+    returns the whole catalog."""
+    countries = [c for c in request.args.get('countries', '').split(',') if c]
+    exp = request.args.get('exp') == '1'
+    since = request.args.get('since', 0, type=int)
+    token = db.session.scalar(
+        db.select(func.coalesce(func.max(PluginChange.seq), 0)))
+    latest = Plugin.last_eversion_pk if exp else Plugin.last_version_pk
+    q = filter_visible(db.select(Plugin), countries).where(
+        latest.is_not(None)).options(selectinload(Plugin.created_by))
+
+    result: list[dict] = []
+    if since <= 0:
+        plugins = db.session.scalars(q.order_by(Plugin.title))
+        result = [plugin_to_dict(p, exp) for p in plugins]
+    elif since < token:
+        changed = set(db.session.scalars(
+            db.select(PluginChange.plugin_id).distinct()
+            .where(PluginChange.seq > since)
+            .where(PluginChange.seq <= token)
+        ))
+        plugins = db.session.scalars(q.where(Plugin.id.in_(changed)))
+        for p in plugins:
+            result.append(plugin_to_dict(p, exp))
+            changed.remove(p.id)
+        result.extend({'id': pid, 'deleted': True} for pid in sorted(changed))
+    return {'token': str(token), 'changes': result}
+
+
+@bp.route('/plugins', methods=['POST'])
+def check_updates():
+    """Takes {'plugins': {id: installed version}, 'exp': bool} and returns
+    the entries of plugins that have a newer version, with links to
+    delta updates from the installed versions where possible."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(
+            data.get('plugins'), dict):
+        return abort(400, 'Expected {"plugins": {"id": "version"}}')
+    if len(data['plugins']) > MAX_UPDATE_CHECKS:
+        return abort(400, f'Up to {MAX_UPDATE_CHECKS} plugins at once')
+    exp = bool(data.get('exp'))
+
+    installed: dict[str, int] = {}
+    for plugin_id, version in data['plugins'].items():
+        try:
+            installed[plugin_id] = PluginVersion.parse_version(version)
+        except (ValueError, TypeError):
+            installed[plugin_id] = 0
+
+    plugins = db.session.scalars(
+        db.select(Plugin).where(Plugin.id.in_(installed))
+        .options(selectinload(Plugin.created_by))
+    )
+    stored = stored_versions(installed)
+    result = []
+    for plugin in plugins:
+        vobj = plugin.last_eversion if exp else plugin.last_version
+        version = installed[plugin.id]
+        if vobj and vobj.version > version:
+            result.append(plugin_to_dict(
+                plugin, exp,
+                version if (plugin.id, version) in stored else None))
+    return result
+
+
 @bp.route('/plugin/<name>')
+@conditional(plugin_validator, personal=False)
 def plugin(name: str):
     plugin: Plugin = db.get_or_404(Plugin, name)
-    return plugin_to_dict(plugin)
+    version = None
+    if installed := request.args.get('installed'):
+        try:
+            version = PluginVersion.parse_version(installed)
+        except ValueError:
+            return abort(400, 'Incorrect version')
+        if (name, version) not in stored_versions({name: version}):
+            version = None
+    return plugin_to_dict(plugin, version=version)
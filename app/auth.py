@@ -1,8 +1,12 @@
+import time
+import threading
+from collections import OrderedDict
 from functools import wraps
 from authlib.integrations.flask_client import OAuth
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import make_transient_to_detached
 from flask import (
-    Blueprint, request, url_for, redirect, session, g, flash,
+    Blueprint, request, url_for, redirect, session, g, flash, current_app,
 )
 from .database import db, User
 
@@ -10,6 +14,13 @@ from .database import db, User
 oauth = OAuth()
 bp = Blueprint('auth', __name__)
 
+# Column values of recently seen users, so that pages for logged in
+# users do not need a query for the user. Keyed by the user id, values
+# are (load time, columns).
+MAX_CACHED_USERS = 1024
+_users_lock = threading.Lock()
+_users: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+
 
 def init_app(app):
     oauth.register(
@@ -33,6 +44,36 @@ def login_required(f):
     return decorated
 
 
+def load_user(user_id: int) -> User:
+    """Returns the user from the cache, attached to the session without
+    a query, or from the database. Raises NoResultFound."""
+    ttl = current_app.config['USER_CACHE_TTL']
+    with _users_lock:
+        entry = _users.get(user_id)
+        if entry and time.monotonic() - entry[0] < ttl:
+            _users.move_to_end(user_id)
+            user = User(**entry[1])
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+    user = db.session.get_one(User, user_id)
+    if ttl > 0:
+        values = {c.key: getattr(user, c.key)
+                  for c in User.__mapper__.column_attrs}
+        with _users_lock:
+            _users[user_id] = (time.monotonic(), values)
+            while len(_users) > MAX_CACHED_USERS:
+                _users.popitem(last=False)
+    return user
+
+
+def forget_user(user_id: int):
+    """Drops the user from the cache in this process. Other processes
+    notice changes after USER_CACHE_TTL."""
+    with _users_lock:
+        _users.pop(user_id, None)
+
+
 def get_user(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -40,7 +81,7 @@ def get_user(f):
             g.user = None
             if 'user_id' in session:
                 try:
-                    g.user = db.session.get_one(User, session['user_id'])
+                    g.user = load_user(session['user_id'])
                 except NoResultFound:
                     flash('Error: no user in the database. Please re-login')
                     del session['user_id']
@@ -64,8 +105,12 @@ def authorize():
     profile = resp.json()
     user_id = profile['user']['id']
 
+    forget_user(user_id)
     try:
         g.user = db.session.get_one(User, user_id)
+        if g.user.name != profile['user']['display_name']:
+            g.user.name = profile['user']['display_name']
+            db.session.commit()
     except NoResultFound:
         # Create a new user
         user = User(
@@ -0,0 +1,83 @@
+"""Precomputed catalog snapshots for the /api/list endpoint.
+
+Serializing the catalog means running the plugin query, loading
+versions and authors and building a bunch of URLs. The result only
+changes when somebody uploads, edits or deletes a plugin, so we keep
+the encoded JSON per host and request parameters, and rebuild it when
+the catalog revision changes.
+
+The revision is the last entry in the change log, which every upload,
+edit and deletion adds to in the same transaction. So all gunicorn
+workers on all servers notice changes made by any of them, with a
+single lookup of the largest primary key.
+"""
+import json
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable
+from flask import current_app, request
+from .database import db, PluginChange
+
+
+MAX_SNAPSHOTS = 128
+
+_lock = threading.Lock()
+# A change log entry number and its time.
+Revision = tuple[int, datetime | None]
+# Values are (revision, build time, JSON, etag).
+_snapshots: OrderedDict[tuple, tuple[Revision, float, bytes, str]] = (
+    OrderedDict())
+
+
+def revision() -> Revision:
+    row = db.session.execute(
+        db.select(PluginChange.seq, PluginChange.created_on)
+        .order_by(PluginChange.seq.desc()).limit(1)
+    ).one_or_none()
+    return (row[0], row[1]) if row else (0, None)
+
+
+def invalidate():
+    """Drops the snapshots in this process. Other processes notice the
+    new change log entry, so this is only to free memory early."""
+    with _lock:
+        _snapshots.clear()
+
+
+def cached_etag(key: tuple) -> str | None:
+    """Returns the etag of the snapshot for the key, if it is current."""
+    key = (request.host_url, *key)
+    rev = revision()
+    ttl = current_app.config['CATALOG_TTL']
+    with _lock:
+        entry = _snapshots.get(key)
+        if entry and entry[0] == rev and time.monotonic() - entry[1] < ttl:
+            return entry[3]
+    return None
+
+
+def get_snapshot(key: tuple,
+                 build: Callable[[], Any]) -> tuple[bytes, str]:
+    """Returns the JSON-encoded catalog for the key and its etag,
+    calling build() on a miss."""
+    key = (request.host_url, *key)
+    rev = revision()
+    ttl = current_app.config['CATALOG_TTL']
+    with _lock:
+        entry = _snapshots.get(key)
+        if entry and entry[0] == rev and time.monotonic() - entry[1] < ttl:
+            _snapshots.move_to_end(key)
+            return entry[2], entry[3]
+
+    data = json.dumps(build(), ensure_ascii=False,
+                      separators=(',', ':')).encode()
+    etag = hashlib.blake2b(data, digest_size=16).hexdigest()
+    with _lock:
+        _snapshots[key] = (rev, time.monotonic(), data, etag)
+        _snapshots.move_to_end(key)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return data, etag
@@ -0,0 +1,162 @@
+"""Conditional GET support for pages and the API.
+
+Views decorated with @conditional() get an ETag and Last-Modified
+computed from a cheap validator, before the view runs. When the
+client already has the current version, it gets a 304 response with
+no queries for plugins, versions or authors.
+
+Catalog-wide validators use the catalog revision, see catalog.py,
+and change at least every CATALOG_TTL seconds to pick up download
+counts. Plugin validators use the last entry in the change log, the
+download count of the plugin and the date, since pages show how many
+days ago versions were published.
+
+Pages can differ for logged in users, so their validators include the
+user id. API responses are the same for everybody and are marked with
+personal=False: then the session is not touched at all, since that
+adds "Vary: Cookie" and keeps shared caches from storing them.
+"""
+import os
+import os.path
+import time
+import hashlib
+from datetime import date, datetime, time as day_time, timezone
+from functools import wraps
+from typing import Callable
+from flask import current_app, request, session, make_response
+from .database import db, Plugin, PluginChange
+from . import catalog
+
+
+# (validator parts, last modified time), or None to skip the checks.
+Validator = tuple[tuple, datetime | None] | None
+
+_code_revision: int | None = None
+
+
+def code_revision() -> int:
+    """Changes when the code or templates are updated, so that
+    responses cached before a deploy are not reused."""
+    global _code_revision
+    if _code_revision is None:
+        root = os.path.dirname(__file__)
+        _code_revision = max(
+            os.stat(os.path.join(path, name)).st_mtime_ns
+            for path, _, files in os.walk(root) for name in files
+            if name.endswith(('.py', '.html')))
+    return _code_revision
+
+
+def _user_id(personal: bool) -> int | None:
+    return session.get('user_id') if personal else None
+
+
+def catalog_validator(**kwargs) -> Validator:
+    ttl = current_app.config['CATALOG_TTL']
+    if ttl <= 0:
+        return None
+    seq, changed_on = catalog.revision()
+    bucket = int(time.time() // ttl)
+    modified = bucket * ttl
+    if changed_on:
+        modified = max(
+            modified, changed_on.replace(tzinfo=timezone.utc).timestamp())
+    return (seq, bucket), datetime.fromtimestamp(modified, timezone.utc)
+
+
+def plugin_validator(name: str, personal: bool = True,
+                     **kwargs) -> Validator:
+    last_change = (
+        db.select(PluginChange.seq, PluginChange.created_on)
+        .where(PluginChange.plugin_id == Plugin.id)
+        .order_by(PluginChange.seq.desc())
+        .limit(1)
+    )
+    row = db.session.execute(
+        db.select(
+            Plugin.downloads, Plugin.created_by_id,
+            last_change.with_only_columns(PluginChange.seq)
+            .scalar_subquery(),
+            last_change.with_only_columns(PluginChange.created_on)
+            .scalar_subquery(),
+        ).where(Plugin.id == name)
+    ).one_or_none()
+    # Owners see upload progress on the page, so it is not cached.
+    if row is None or row[1] == _user_id(personal):
+        return None
+    downloads, _, seq, created_on = row
+    today = date.today()
+    # Changes at midnight too, for clients that only send
+    # If-Modified-Since.
+    modified = datetime.combine(today, day_time()).astimezone(timezone.utc)
+    if created_on:
+        modified = max(modified, created_on.replace(tzinfo=timezone.utc))
+    return (name, seq, downloads, today), modified
+
+
+def _make_etag(parts: tuple, personal: bool = True) -> str:
+    # Different pages for the same plugin get different tags, since
+    # encoding.py caches compressed bodies by the tag.
+    data = repr((code_revision(), request.full_path,
+                 _user_id(personal), *parts))
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+def set_validators(resp, etag: str, modified: datetime | None = None,
+                   personal: bool = True):
+    if not resp.get_etag()[0]:
+        resp.set_etag(etag)
+    if modified:
+        resp.last_modified = modified
+    # Pages for logged in users differ, so shared caches cannot keep them.
+    if _user_id(personal) is not None:
+        resp.cache_control.private = True
+    else:
+        resp.cache_control.public = True
+    resp.cache_control.no_cache = True
+
+
+def not_modified(etag: str, modified: datetime | None = None,
+                 personal: bool = True):
+    """Returns a 304 response if the client has the current version,
+    including compressed ones from encoding.py, otherwise None."""
+    tag = None
+    if request.if_none_match:
+        for candidate in (etag, f'{etag}-br', f'{etag}-gzip'):
+            if request.if_none_match.contains_weak(candidate):
+                tag = candidate
+                break
+    elif request.if_modified_since and modified:
+        if modified.replace(microsecond=0) <= request.if_modified_since:
+            tag = etag
+    if tag is None:
+        return None
+    resp = current_app.response_class(status=304)
+    set_validators(resp, tag, modified, personal)
+    return resp
+
+
+def conditional(validator: Callable[..., Validator], personal: bool = True):
+    """Answers conditional GET requests for the view with 304 when the
+    validator has not changed. The validator is called with the view
+    arguments and personal."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            # Pages with flashed messages must be shown once.
+            if (request.method not in ('GET', 'HEAD') or
+                    (personal and '_flashes' in session)):
+                return f(*args, **kwargs)
+            validated = validator(personal=personal, **kwargs)
+            if validated is None:
+                return f(*args, **kwargs)
+            parts, modified = validated
+            etag = _make_etag(parts, personal)
+            if resp := not_modified(etag, modified, personal):
+                return resp
+            resp = make_response(f(*args, **kwargs))
+            if resp.status_code == 200:
+                set_validators(resp, etag, modified, personal)
+            return resp
+        return decorated
+    return decorator
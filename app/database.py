@@ -1,21 +1,24 @@
 import string
 import random
-import os
-from flask import current_app
+import json
+import base64
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import String, ForeignKey, func, sql
+from sqlalchemy import (
+    JSON, String, ForeignKey, Index, func, sql, tuple_,
+)
+from .sqlite import RoutingSession
 from sqlalchemy.orm import (
-    DeclarativeBase, Mapped, mapped_column, relationship, aliased,
+    DeclarativeBase, Mapped, mapped_column, relationship,
 )
-from sqlalchemy.ext.hybrid import hybrid_property
 
 
 class Base(DeclarativeBase):
     pass
 
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base,
+                session_options={'class_': RoutingSession})
 
 
 class User(db.Model):
@@ -33,43 +36,88 @@ class User(db.Model):
 
 
 class Plugin(db.Model):
+    __table_args__ = (
+        Index('ix_plugin_visible', 'hidden', 'country'),
+    )
+
     id: Mapped[str] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(String(250), unique=True)
     description: Mapped[str]
+    description_html: Mapped[str | None]
     created_by_id: Mapped[int] = mapped_column(ForeignKey('user.osm_id'))
     created_by: Mapped[User] = relationship()
     homepage: Mapped[str | None]
     country: Mapped[str | None] = mapped_column(String(32))
     hidden: Mapped[bool] = mapped_column(server_default=sql.false())
     icon: Mapped[str | None]
+    icon_hash: Mapped[str | None] = mapped_column(String(64))
+    icon_thumbnails: Mapped[bool] = mapped_column(server_default=sql.false())
+
+    # Denormalized from versions, see update_stats().
+    downloads: Mapped[int] = mapped_column(server_default='0')
+    last_version_pk: Mapped[int | None]
+    last_eversion_pk: Mapped[int | None]
+    updated_on: Mapped[datetime | None]
+    # Changes with every edit, see bump_revision().
+    revision: Mapped[int] = mapped_column(server_default='0')
+    # Set here for microseconds, to tell apart plugins that were deleted
+    # and uploaded again under the same id, see fragments.py.
+    created_on: Mapped[datetime | None] = mapped_column(default=datetime.now)
 
     versions: Mapped[list["PluginVersion"]] = relationship(
         back_populates='plugin', order_by='desc(PluginVersion.created_on)',
         cascade='all, delete',
     )
+    last_version: Mapped["PluginVersion | None"] = relationship(
+        primaryjoin='foreign(Plugin.last_version_pk) == PluginVersion.pk',
+        viewonly=True, lazy='selectin',
+    )
+    last_eversion: Mapped["PluginVersion | None"] = relationship(
+        primaryjoin='foreign(Plugin.last_eversion_pk) == PluginVersion.pk',
+        viewonly=True, lazy='selectin',
+    )
 
     @property
-    def icon_file(self) -> str | None:
+    def icon_key(self) -> str | None:
+        """The storage key of the icon, see storage.py."""
         if not self.icon:
             return None
-        return os.path.join(
-            current_app.instance_path, 'plugins', self.id,
-            f'icon.{self.icon}')
-
-    @hybrid_property
-    def downloads(self):
-        return sum(v.downloads for v in self.versions)
-
-    @downloads.expression
-    def _downloads_expr(cls):
-        return (
-            db.select(func.sum(PluginVersion.downloads))
-            .where(PluginVersion.plugin_id == cls.id)
-            .label('downloads')
+        if self.icon_hash:
+            return f'icons/{self.icon_hash}.{self.icon}'
+        return f'plugins/{self.id}/icon.{self.icon}'
+
+    def bump_revision(self):
+        """Marks rendered parts of pages for the plugin as outdated in
+        all processes, see fragments.py. Only for stored plugins."""
+        self.revision = Plugin.revision + 1
+
+    def update_stats(self):
+        """Recalculates the denormalized fields after versions have
+        been added or deleted. Flushes the session."""
+        db.session.flush()
+        self.last_version_pk = latest_version_query(
+            PluginVersion.pk, self.id, stable=True)
+        self.last_eversion_pk = latest_version_query(
+            PluginVersion.pk, self.id, stable=False)
+        self.updated_on = latest_version_query(
+            PluginVersion.created_on, self.id, stable=False)
+        # Calculated by the database to not lose concurrent increments.
+        self.downloads = (
+            db.select(func.coalesce(func.sum(PluginVersion.downloads), 0))
+            .where(PluginVersion.plugin_id == self.id)
+            .scalar_subquery()
         )
 
 
 class PluginVersion(db.Model):
+    __table_args__ = (
+        Index('ix_plugin_version_latest',
+              'plugin_id', 'experimental', 'created_on'),
+        Index('ix_plugin_version_created', 'plugin_id', 'created_on'),
+        Index('ix_plugin_version_version', 'plugin_id', 'version',
+              unique=True),
+    )
+
     pk: Mapped[int] = mapped_column(primary_key=True)
     plugin_id: Mapped[str] = mapped_column(ForeignKey('plugin.id'))
     plugin: Mapped[Plugin] = relationship(back_populates='versions')
@@ -80,20 +128,33 @@ class PluginVersion(db.Model):
     created_by_id: Mapped[int] = mapped_column(ForeignKey('user.osm_id'))
     created_by: Mapped[User] = relationship()
     changelog: Mapped[str | None]
+    changelog_html: Mapped[str | None]
     experimental: Mapped[bool] = mapped_column(server_default=sql.true())
+    sha256: Mapped[str | None] = mapped_column(String(64), index=True)
 
     @property
-    def filename(self) -> str:
-        return os.path.join(
-            current_app.instance_path, 'plugins', self.plugin_id,
-            f'{self.version}.edp')
+    def file_key(self) -> str:
+        """The storage key of the package, see storage.py."""
+        if self.sha256:
+            return self.package_key(self.sha256)
+        return f'plugins/{self.plugin_id}/{self.version}.edp'
+
+    @staticmethod
+    def package_key(sha256: str) -> str:
+        # Packages are stored by content, so identical files are
+        # stored once.
+        return f'packages/{sha256[:2]}/{sha256}.edp'
 
     @property
     def version_str(self) -> str:
-        if self.version < 1000:
-            return str(self.version)
-        major = self.version // 1000 - 1
-        minor = self.version % 1000
+        return self.format_version(self.version)
+
+    @staticmethod
+    def format_version(version: int) -> str:
+        if version < 1000:
+            return str(version)
+        major = version // 1000 - 1
+        minor = version % 1000
         return f'{major}.{minor}'
 
     @staticmethod
@@ -120,27 +181,80 @@ class PluginVersion(db.Model):
         return result
 
 
-latest_version_subquery = (
-    db.select(PluginVersion).distinct(PluginVersion.plugin_id)
-    .where(~PluginVersion.experimental)
-    .order_by(PluginVersion.plugin_id, PluginVersion.created_on.desc())
-    .alias()
-)
-latest_version_alias = aliased(PluginVersion, latest_version_subquery)
-Plugin.last_version = relationship(
-    latest_version_alias,
-    uselist=False,
-    lazy='selectin',
-)
+class PluginChange(db.Model):
+    """A log entry for the change feed. Plugin ids are not foreign keys,
+    so that entries for deleted plugins serve as tombstones."""
+    seq: Mapped[int] = mapped_column(primary_key=True)
+    plugin_id: Mapped[str] = mapped_column(index=True)
+    created_on: Mapped[datetime] = mapped_column(
+        server_default=func.CURRENT_TIMESTAMP())
+    deleted: Mapped[bool] = mapped_column(server_default=sql.false())
 
-latest_eversion_subquery = (
-    db.select(PluginVersion).distinct(PluginVersion.plugin_id)
-    .order_by(PluginVersion.plugin_id, PluginVersion.created_on.desc())
-    .alias()
-)
-latest_eversion_alias = aliased(PluginVersion, latest_eversion_subquery)
-Plugin.last_eversion = relationship(
-    latest_eversion_alias,
-    uselist=False,
-    lazy='selectin',
-)
+    @staticmethod
+    def record(plugin_id: str, deleted: bool = False):
+        db.session.add(PluginChange(plugin_id=plugin_id, deleted=deleted))
+
+
+class Job(db.Model):
+    """A task for the background worker, see jobs.py."""
+    __table_args__ = (
+        Index('ix_job_status', 'status', 'id'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(String(32))
+    payload: Mapped[dict] = mapped_column(JSON)
+    status: Mapped[str] = mapped_column(String(16), server_default='queued')
+    error: Mapped[str | None]
+    plugin_id: Mapped[str | None] = mapped_column(index=True)
+    created_by_id: Mapped[int] = mapped_column(ForeignKey('user.osm_id'))
+    created_by: Mapped[User] = relationship()
+    created_on: Mapped[datetime] = mapped_column(
+        server_default=func.CURRENT_TIMESTAMP())
+    started_on: Mapped[datetime | None]
+    finished_on: Mapped[datetime | None]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+
+def latest_version_query(column, plugin_id, stable: bool):
+    """Returns a scalar subquery for a column of the latest version of
+    a plugin. It is portable and uses the ix_plugin_version_latest or
+    ix_plugin_version_created index to pick just one row."""
+    q = (
+        db.select(column)
+        .where(PluginVersion.plugin_id == plugin_id)
+        .order_by(PluginVersion.created_on.desc(), PluginVersion.pk.desc())
+        .limit(1)
+    )
+    if stable:
+        q = q.where(PluginVersion.experimental == sql.false())
+    return q.scalar_subquery()
+
+
+def encode_cursor(plugin: Plugin) -> str:
+    data = json.dumps([plugin.title, plugin.id]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def plugins_page(q, cursor: str | None,
+                 limit: int) -> tuple[list[Plugin], str | None]:
+    """Returns a page of plugins ordered by title, starting after
+    the cursor, and a cursor for the next page. Raises ValueError
+    for an invalid cursor."""
+    if cursor:
+        try:
+            title, plugin_id = json.loads(base64.urlsafe_b64decode(
+                cursor + '=' * (-len(cursor) % 4)))
+        except Exception:
+            raise ValueError('Invalid cursor')
+        if not isinstance(title, str) or not isinstance(plugin_id, str):
+            raise ValueError('Invalid cursor')
+        q = q.where(tuple_(Plugin.title, Plugin.id) > (title, plugin_id))
+    plugins = list(db.session.scalars(
+        q.order_by(Plugin.title, Plugin.id).limit(limit + 1)))
+    if len(plugins) > limit:
+        return plugins[:limit], encode_cursor(plugins[limit - 1])
+    return plugins, None
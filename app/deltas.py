@@ -0,0 +1,101 @@
+"""Delta updates between package versions.
+
+A delta is a zip file with the files that were added or changed in
+the newer package, under "files/", and delta.json with the names and
+CRC-32 sums of all files in the newer package. A client that has the
+older package rebuilds the newer one by taking the other files from
+it, and drops files that are not listed. Plugins usually change a few
+files at a time, so deltas are much smaller than packages.
+
+Deltas are made on the first request and kept in the storage under
+the digests of both packages, so they never get outdated. When a delta
+is not smaller than the newer package, an empty marker is kept instead,
+and the package is sent in its place.
+"""
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+from typing import BinaryIO
+from .database import PluginVersion
+from . import storage
+
+
+CHUNK_SIZE = 64 * 1024
+MANIFEST = 'delta.json'
+
+
+def delta_key(old_sha256: str, new_sha256: str,
+              ext: str = 'edpdelta') -> str:
+    # Grouped by the new package, to delete them together.
+    return f'deltas/{new_sha256}/{old_sha256}.{ext}'
+
+
+def make_delta(old: BinaryIO, new: BinaryIO, out: BinaryIO,
+               manifest: dict):
+    """Writes the delta between two packages. Files are compared by
+    their sizes and sums, so unchanged ones are not even unpacked."""
+    with (zipfile.ZipFile(old) as old_zip,
+          zipfile.ZipFile(new) as new_zip,
+          zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as delta):
+        old_files = {info.filename: (info.CRC, info.file_size)
+                     for info in old_zip.infolist() if not info.is_dir()}
+        files: dict[str, int] = {}
+        for info in new_zip.infolist():
+            if info.is_dir():
+                continue
+            files[info.filename] = info.CRC
+            if old_files.get(info.filename) == (info.CRC, info.file_size):
+                continue
+            # Keeping timestamps makes deltas the same on every server.
+            target = zipfile.ZipInfo(
+                f'files/{info.filename}', date_time=info.date_time)
+            target.compress_type = zipfile.ZIP_DEFLATED
+            with (new_zip.open(info) as src,
+                  delta.open(target, 'w', force_zip64=True) as dst):
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        target = zipfile.ZipInfo(MANIFEST, date_time=(1980, 1, 1, 0, 0, 0))
+        target.compress_type = zipfile.ZIP_DEFLATED
+        delta.writestr(target, json.dumps({**manifest, 'files': files}))
+
+
+def get_delta(old: PluginVersion, new: PluginVersion) -> str | None:
+    """Returns the storage key of the delta between two versions,
+    making it if needed, or None if the delta would not be smaller than
+    the new package. Both must have been stored by digest."""
+    assert old.sha256 and new.sha256
+    key = delta_key(old.sha256, new.sha256)
+    if storage.get().exists(key):
+        return key
+    no_delta = delta_key(old.sha256, new.sha256, 'nodelta')
+    if storage.get().exists(no_delta):
+        return None
+    with tempfile.TemporaryFile() as out:
+        with (storage.get().open(old.file_key) as old_file,
+              storage.get().open(new.file_key) as new_file):
+            make_delta(old_file, new_file, out, {
+                'id': new.plugin_id,
+                'from': old.version_str,
+                'to': new.version_str,
+                'from_sha256': old.sha256,
+                'sha256': new.sha256,
+            })
+            new_size = new_file.seek(0, 2)
+        if out.tell() >= new_size:
+            storage.get().save(no_delta, io.BytesIO())
+            return None
+        out.seek(0)
+        storage.get().save(key, out)
+    return key
+
+
+def remove_deltas(sha256: str):
+    """Deletes deltas to and from a package that was deleted. Deltas
+    from it are under other packages, so this lists all deltas, but
+    packages are rarely deleted."""
+    store = storage.get()
+    store.delete_prefix(f'deltas/{sha256}/')
+    for key in list(store.keys('deltas/')):
+        if key.rsplit('/', 1)[-1].split('.')[0] == sha256:
+            store.delete(key)
@@ -0,0 +1,189 @@
+"""Write-behind accounting for package downloads.
+
+Committing a counter increment on every download takes the database
+write lock, which on SQLite serializes all workers. Instead, we collect
+increments and flush them in batches, either when enough have piled up,
+or every DOWNLOAD_FLUSH_INTERVAL seconds, and on exit.
+
+With DOWNLOAD_SPOOL enabled, increments are appended to a file in
+the instance directory shared by all workers on the host, so that any
+worker can flush them. Otherwise they are kept in process memory.
+Spooled batches are deleted only after their counts are committed, so
+a failed flush or a crash leaves them for the next one.
+Setting the interval to zero restores committing on every download.
+"""
+import os
+import os.path
+import glob
+import time
+import atexit
+import fcntl
+import threading
+from collections import Counter
+from flask import Flask
+from sqlalchemy import update, bindparam
+from .database import db, Plugin, PluginVersion
+
+
+_app: Flask | None = None
+_lock = threading.Lock()
+# Keys are (version pk, plugin id).
+_pending: Counter[tuple[int, str]] = Counter()
+_recorded = 0
+_last_flush = time.monotonic()
+_thread: threading.Thread | None = None
+
+
+def init_app(app: Flask):
+    global _app
+    _app = app
+    atexit.register(flush)
+
+
+def _spool_file() -> str:
+    assert _app
+    return os.path.join(_app.instance_path, 'downloads.spool')
+
+
+def _append_to_spool(pk: int, plugin_id: str):
+    while True:
+        fd = os.open(_spool_file(), os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            if os.fstat(fd).st_nlink > 0:
+                os.write(fd, f'{pk} {plugin_id}\n'.encode())
+                return
+            # The file has been flushed and deleted while we waited.
+        finally:
+            os.close(fd)
+
+
+def _claim_spool() -> tuple[Counter[tuple[int, str]], list[tuple[str, int]]]:
+    """Returns counts from the spool and the batch files they were read
+    from, with open descriptors that keep them locked. The caller
+    deletes the files after committing and closes the descriptors."""
+    counts: Counter[tuple[int, str]] = Counter()
+    claimed: list[tuple[str, int]] = []
+    path = _spool_file()
+    try:
+        os.rename(path, f'{path}.{os.getpid()}.{time.time_ns()}')
+    except FileNotFoundError:
+        pass
+
+    # Also pick up batches left from interrupted flushes.
+    for name in glob.glob(f'{glob.escape(path)}.*'):
+        try:
+            fd = os.open(name, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another worker is flushing it.
+            os.close(fd)
+            continue
+        if os.fstat(fd).st_nlink == 0:
+            os.close(fd)
+            continue
+        claimed.append((name, fd))
+        with os.fdopen(os.dup(fd)) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[0].isdigit():
+                    counts[int(parts[0]), parts[1]] += 1
+    return counts, claimed
+
+
+def _apply(counts: Counter[tuple[int, str]]):
+    if not counts:
+        return
+    per_plugin: Counter[str] = Counter()
+    for (_, plugin_id), n in counts.items():
+        per_plugin[plugin_id] += n
+
+    vtable = PluginVersion.__table__
+    db.session.execute(
+        update(vtable)
+        .where(vtable.c.pk == bindparam('vpk'))
+        .values(downloads=vtable.c.downloads + bindparam('n')),
+        [{'vpk': pk, 'n': n} for (pk, _), n in counts.items()],
+    )
+    ptable = Plugin.__table__
+    db.session.execute(
+        update(ptable)
+        .where(ptable.c.id == bindparam('pid'))
+        .values(downloads=ptable.c.downloads + bindparam('n')),
+        [{'pid': pid, 'n': n} for pid, n in per_plugin.items()],
+    )
+    db.session.commit()
+
+
+def flush():
+    """Writes all pending download counts to the database."""
+    global _last_flush, _recorded
+    if not _app:
+        return
+    with _lock:
+        counts = _pending.copy()
+        _pending.clear()
+        _recorded = 0
+        _last_flush = time.monotonic()
+    claimed: list[tuple[str, int]] = []
+    with _app.app_context():
+        try:
+            spooled: Counter[tuple[int, str]] = Counter()
+            if _app.config['DOWNLOAD_SPOOL']:
+                spooled, claimed = _claim_spool()
+            _apply(counts + spooled)
+            for name, _ in claimed:
+                os.unlink(name)
+        except Exception:
+            db.session.rollback()
+            # Spooled counts stay in their files.
+            with _lock:
+                _pending.update(counts)
+            raise
+        finally:
+            for _, fd in claimed:
+                os.close(fd)
+
+
+def _flush_periodically():
+    assert _app
+    while True:
+        time.sleep(_app.config['DOWNLOAD_FLUSH_INTERVAL'])
+        try:
+            flush()
+        except Exception:
+            _app.logger.exception('Failed to flush download counts')
+
+
+def record(vobj: PluginVersion):
+    """Counts one download of the package version."""
+    global _recorded, _thread
+    assert _app
+    config = _app.config
+    if not config['DOWNLOAD_FLUSH_INTERVAL']:
+        _apply(Counter({(vobj.pk, vobj.plugin_id): 1}))
+        return
+
+    with _lock:
+        if config['DOWNLOAD_SPOOL']:
+            _append_to_spool(vobj.pk, vobj.plugin_id)
+        else:
+            _pending[vobj.pk, vobj.plugin_id] += 1
+        _recorded += 1
+        need_flush = (
+            _recorded >= config['DOWNLOAD_FLUSH_SIZE'] or
+            time.monotonic() - _last_flush >= config[
+                'DOWNLOAD_FLUSH_INTERVAL'])
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(
+                target=_flush_periodically, daemon=True)
+            _thread.start()
+    if need_flush:
+        # Counts stay pending on errors, the download must not fail.
+        try:
+            flush()
+        except Exception:
+            _app.logger.exception('Failed to flush download counts')
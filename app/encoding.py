@@ -0,0 +1,85 @@
+"""Compressed and conditional responses for the API.
+
+JSON responses get an ETag and are compressed with brotli (when the
+module is installed) or gzip, depending on Accept-Encoding. Compressed
+bodies are kept in a bounded LRU keyed by the ETag, so a catalog that
+has not changed is compressed once, not on every request.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request, current_app
+from werkzeug.wrappers import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MIN_SIZE = 1024
+MAX_CACHED = 64
+
+_lock = threading.Lock()
+_cache: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=9)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _encoded(etag: str, encoding: str, data: bytes) -> bytes:
+    key = (etag, encoding)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    result = _compress(data, encoding)
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+    return result
+
+
+def choose_encoding() -> str | None:
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def encode_response(resp: Response) -> Response:
+    """Adds an ETag, compresses the response if the client accepts it,
+    and answers conditional requests with 304."""
+    if not current_app.config['API_COMPRESSION']:
+        return resp
+    if resp.status_code == 304:
+        # The tag in a 304 depends on the encoding as well.
+        resp.vary.add('Accept-Encoding')
+        return resp
+    if (
+            request.method not in ('GET', 'HEAD') or
+            resp.status_code != 200 or resp.direct_passthrough or
+            resp.is_streamed or 'Content-Encoding' in resp.headers):
+        return resp
+
+    data = resp.get_data()
+    etag, _ = resp.get_etag()
+    if not etag:
+        etag = hashlib.blake2b(data, digest_size=16).hexdigest()
+    resp.vary.add('Accept-Encoding')
+
+    encoding = choose_encoding() if len(data) >= MIN_SIZE else None
+    if encoding:
+        resp.set_data(_encoded(etag, encoding, data))
+        resp.headers['Content-Encoding'] = encoding
+        # Each representation needs its own strong validator.
+        etag = f'{etag}-{encoding}'
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
@@ -0,0 +1,74 @@
+"""Cache for rendered parts of pages.
+
+Templates wrap parts of plugin pages and lists that are the same for
+most visitors in a call block:
+
+    {% call fragment('row', p, mine) %}
+      ...
+    {% endcall %}
+
+The block is rendered on a miss only, so relationships it uses are
+not even loaded on a hit. Parts are kept per plugin id, and the key
+has everything else they depend on. The plugin revision changes with
+every edit in any process, see Plugin.bump_revision(). A plugin that
+was deleted and uploaded again under the same id starts from the same
+revision, but has a different creation time. The current
+date is in all keys too, since parts show "N days ago". Author names
+are not, so a new name shows up the next day or after the next edit.
+
+Entries live in a per-process LRU bounded by the total size.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Callable
+from markupsafe import Markup
+from .database import Plugin
+
+
+MAX_SIZE = 16 * 1024 * 1024
+
+_lock = threading.Lock()
+# Keyed by the plugin id and the rest of the key.
+_fragments: OrderedDict[tuple[str, tuple], str] = OrderedDict()
+_size = 0
+
+
+def fragment(name: str, plugin: Plugin, *args,
+             caller: Callable[[], str]) -> Markup:
+    """Returns the named part for the plugin, rendering it if needed.
+    Other arguments it depends on are added to the key."""
+    global _size
+    key = (plugin.id, (date.today(), name, plugin.created_on,
+                       plugin.revision, plugin.downloads, *args))
+    with _lock:
+        html = _fragments.get(key)
+        if html is not None:
+            _fragments.move_to_end(key)
+            return Markup(html)
+
+    html = caller()
+    with _lock:
+        if key not in _fragments:
+            _fragments[key] = html
+            _size += len(html)
+        while _size > MAX_SIZE and _fragments:
+            _, old = _fragments.popitem(last=False)
+            _size -= len(old)
+    return Markup(html)
+
+
+def invalidate(plugin_id: str):
+    """Drops parts for the plugin from this process. Other processes
+    stop using theirs when the plugin revision changes."""
+    global _size
+    with _lock:
+        for key in [k for k in _fragments if k[0] == plugin_id]:
+            _size -= len(_fragments.pop(key))
+
+
+def clear():
+    global _size
+    with _lock:
+        _fragments.clear()
+        _size = 0
@@ -0,0 +1,107 @@
+"""Plugin icons stored under their content hashes.
+
+Since a file name changes whenever the icon does, icons can be served
+from /icon/h/<file> with no database lookup and cached forever.
+When Pillow is installed, raster icons also get small PNG thumbnails
+for lists. SVG icons are served as they are.
+"""
+import io
+import hashlib
+from flask import current_app, url_for
+from sqlalchemy import func
+from .database import db, Plugin
+from . import storage
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # type: ignore[assignment]
+
+
+THUMBNAIL_SIZES = (40, 80)
+# Small files can decode to huge images, limit what is unpacked.
+MAX_ICON_PIXELS = 2048 * 2048
+if Image is not None:
+    Image.MAX_IMAGE_PIXELS = MAX_ICON_PIXELS
+MIME_TYPES = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+
+def icon_filename(icon_hash: str, ext: str, size: int | None = None) -> str:
+    if size:
+        return f'{icon_hash}-{size}.png'
+    return f'{icon_hash}.{ext}'
+
+
+def icon_url(plugin: Plugin, size: int | None = None,
+             external: bool = False) -> str | None:
+    """Returns a URL for the icon, or its thumbnail if possible."""
+    if not plugin.icon:
+        return None
+    if not plugin.icon_hash:
+        return url_for('plugins.icon', name=plugin.id, ext=plugin.icon,
+                       _external=external)
+    filename = icon_filename(
+        plugin.icon_hash, plugin.icon,
+        size if plugin.icon_thumbnails else None)
+    return url_for('plugins.hashed_icon', filename=filename,
+                   _external=external)
+
+
+def _write(name: str, data: bytes):
+    key = f'icons/{name}'
+    if not storage.get().exists(key):
+        storage.get().save(key, io.BytesIO(data))
+
+
+def _make_thumbnails(icon_hash: str, data: bytes) -> bool:
+    largest = max(THUMBNAIL_SIZES)
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # The size is read from the header, nothing is decoded yet.
+            if img.width * img.height > MAX_ICON_PIXELS:
+                current_app.logger.warning(
+                    'Icon is too large for thumbnails: %sx%s', *img.size)
+                return False
+            img.draft('RGBA', (largest, largest))
+            img.thumbnail((largest, largest))
+            rgba = img.convert('RGBA')
+            for size in THUMBNAIL_SIZES:
+                thumb = rgba.copy()
+                thumb.thumbnail((size, size))
+                buf = io.BytesIO()
+                thumb.save(buf, 'PNG', optimize=True)
+                _write(icon_filename(icon_hash, 'png', size), buf.getvalue())
+    except (OSError, ValueError, Image.DecompressionBombError):
+        current_app.logger.warning('Could not make thumbnails for an icon')
+        return False
+    return True
+
+
+def store_icon(data: bytes, ext: str) -> tuple[str, bool]:
+    """Saves the icon and its thumbnails. Returns the hash and whether
+    thumbnails were made."""
+    icon_hash = hashlib.sha256(data).hexdigest()[:20]
+    _write(icon_filename(icon_hash, ext), data)
+    thumbnails = False
+    if Image is not None and ext != 'svg':
+        thumbnails = _make_thumbnails(icon_hash, data)
+    return icon_hash, thumbnails
+
+
+def remove_unused_icon(icon_hash: str | None, ext: str | None):
+    """Deletes a stored icon and its thumbnails if no plugin refers
+    to them anymore. Call this after committing."""
+    if not icon_hash or not ext or db.session.scalar(
+            db.select(func.count(Plugin.id))
+            .where(Plugin.icon_hash == icon_hash)):
+        return
+    names = [icon_filename(icon_hash, ext)]
+    names.extend(icon_filename(icon_hash, 'png', size)
+                 for size in THUMBNAIL_SIZES)
+    for name in names:
+        storage.get().delete(f'icons/{name}')
@@ -0,0 +1,129 @@
+"""Background jobs stored in the database.
+
+Slow work, like processing an uploaded package, is queued as a row in
+the job table and picked up by a worker started with "flask worker".
+Any number of workers can run: a job is claimed with a conditional
+UPDATE, so only one of them gets it.
+
+With BACKGROUND_JOBS disabled, nothing is queued and the callers do
+the work inside the request, so a worker is not needed.
+"""
+import time
+import click
+from datetime import datetime, timedelta
+from typing import Callable, cast
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import CursorResult, update, delete
+from .database import db, Job, User
+
+
+# Running jobs older than this are assumed to be left by a dead worker.
+STALE_AFTER = timedelta(hours=1)
+KEEP_FINISHED = timedelta(days=7)
+
+_handlers: dict[str, Callable[[Job], None]] = {}
+
+
+class JobFailed(Exception):
+    """Raised by handlers, the message is shown to the user."""
+
+
+def handler(kind: str):
+    """Registers a function to run jobs of this kind."""
+    def decorator(f: Callable[[Job], None]):
+        _handlers[kind] = f
+        return f
+    return decorator
+
+
+def enabled() -> bool:
+    return current_app.config['BACKGROUND_JOBS']
+
+
+def enqueue(kind: str, user: User, plugin_id: str | None = None,
+            **payload) -> Job:
+    """Adds a job to the session. It is queued on commit."""
+    job = Job(kind=kind, payload=payload, status='queued',
+              plugin_id=plugin_id, created_by=user)
+    db.session.add(job)
+    return job
+
+
+def claim() -> Job | None:
+    """Marks the oldest queued job as running and returns it."""
+    while True:
+        job_id = db.session.scalar(
+            db.select(Job.id).where(Job.status == 'queued')
+            .order_by(Job.id).limit(1))
+        if job_id is None:
+            return None
+        result = cast(CursorResult, db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', started_on=datetime.now())))
+        db.session.commit()
+        if result.rowcount:
+            return db.session.get(Job, job_id)
+        # Another worker was faster.
+
+
+def run(job: Job):
+    """Runs the job and records the outcome."""
+    try:
+        _handlers[job.kind](job)
+        status, error = 'done', None
+    except JobFailed as e:
+        db.session.rollback()
+        status, error = 'failed', str(e)
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception(f'Job {job.id} ({job.kind}) failed')
+        status, error = 'failed', 'Internal error'
+    job = db.session.get_one(Job, job.id)
+    job.status = status
+    job.error = error
+    job.finished_on = datetime.now()
+    db.session.commit()
+
+
+def cleanup():
+    """Requeues jobs of dead workers and forgets old finished jobs."""
+    now = datetime.now()
+    db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.started_on < now - STALE_AFTER)
+        .values(status='queued'))
+    db.session.execute(
+        delete(Job)
+        .where(Job.status.in_(('done', 'failed')),
+               Job.finished_on < now - KEEP_FINISHED))
+    db.session.commit()
+
+
+@click.command('worker')
+@with_appcontext
+@click.option('--once', is_flag=True,
+              help='Exit when there are no queued jobs.')
+@click.option('--interval', default=2.0,
+              help='Seconds to wait between polls of an empty queue.')
+def worker_command(once: bool, interval: float):
+    """Runs queued background jobs."""
+    cleanup()
+    last_cleanup = time.monotonic()
+    while True:
+        job = claim()
+        if job is not None:
+            click.echo(f'Running job {job.id}: {job.kind}')
+            run(job)
+            continue
+        if once:
+            break
+        if time.monotonic() - last_cleanup > 3600:
+            cleanup()
+            last_cleanup = time.monotonic()
+        time.sleep(interval)
+
+
+def init_app(app):
+    app.cli.add_command(worker_command)
@@ -0,0 +1,45 @@
+"""Markdown rendering for descriptions and changelogs.
+
+HTML is rendered once when the text is saved and stored next to it,
+so pages only output it. Raw HTML in the source is escaped.
+"""
+import click
+from flask.cli import with_appcontext
+import markdown2
+from .database import db, Plugin, PluginVersion
+
+
+EXTRAS = {
+    'breaks': {'on_newline': True},
+    'cuddled-lists': None,
+    'fenced-code-blocks': None,
+    'nofollow': None,
+    'strike': None,
+    'tables': None,
+    'target-blank-links': None,
+}
+
+
+def render_markdown(text: str | None) -> str | None:
+    if text is None:
+        return None
+    return markdown2.markdown(text, safe_mode='escape', extras=EXTRAS)
+
+
+@click.command('render-markdown')
+@with_appcontext
+def render_markdown_command():
+    """Renders HTML for all descriptions and changelogs."""
+    plugins = list(db.session.scalars(db.select(Plugin)))
+    for plugin in plugins:
+        plugin.description_html = render_markdown(plugin.description)
+    versions = list(db.session.scalars(db.select(PluginVersion)))
+    for vobj in versions:
+        vobj.changelog_html = render_markdown(vobj.changelog)
+    db.session.commit()
+    click.echo(f'Rendered {len(plugins)} plugins '
+               f'and {len(versions)} versions.')
+
+
+def init_app(app):
+    app.cli.add_command(render_markdown_command)
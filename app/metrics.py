@@ -0,0 +1,172 @@
+"""Per-endpoint request and SQL statistics in the Prometheus format.
+
+Counts requests, their latency, SQL statements and time spent in the
+database for every endpoint, and serves it all on /api/metrics, where
+it cannot shadow a plugin page. In debug mode, responses also get
+X-Query-Count and Server-Timing headers.
+
+The numbers are kept per process: with several gunicorn workers, each
+scrape sees only the worker that answered it.
+"""
+import time
+import threading
+from collections import defaultdict
+from flask import (
+    Flask, g, request, has_app_context, request_started, request_finished,
+    got_request_exception,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.buckets = [0] * len(BUCKETS)
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def add(self, seconds: float, queries: int, db_seconds: float,
+            error: bool):
+        self.requests += 1
+        if error:
+            self.errors += 1
+        self.seconds += seconds
+        self.queries += queries
+        self.db_seconds += db_seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+_lock = threading.Lock()
+_stats: dict[str, EndpointStats] = defaultdict(EndpointStats)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if has_app_context() and 'metrics_start' in g:
+        conn.info.setdefault('metrics_query_start', []).append(
+            time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    starts = conn.info.get('metrics_query_start')
+    if starts and has_app_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_db_seconds += time.perf_counter() - starts.pop()
+
+
+def _request_started(sender, **extra):
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_db_seconds = 0.0
+
+
+def _request_exception(sender, exception, **extra):
+    g.metrics_error = True
+
+
+def _request_finished(sender, response, **extra):
+    if 'metrics_start' not in g:
+        return
+    seconds = time.perf_counter() - g.metrics_start
+    endpoint = request.endpoint or 'unknown'
+    error = g.get('metrics_error', False) or response.status_code >= 500
+    with _lock:
+        _stats[endpoint].add(seconds, g.metrics_queries,
+                             g.metrics_db_seconds, error)
+
+    if sender.debug:
+        response.headers['X-Query-Count'] = str(g.metrics_queries)
+        response.headers['Server-Timing'] = (
+            f'db;dur={g.metrics_db_seconds * 1000:.1f}, '
+            f'total;dur={seconds * 1000:.1f}')
+
+
+def _label(endpoint: str) -> str:
+    return endpoint.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render() -> str:
+    lines = [
+        '# HELP edpr_requests_total Requests served.',
+        '# TYPE edpr_requests_total counter',
+    ]
+    with _lock:
+        stats = sorted(_stats.items())
+        for endpoint, s in stats:
+            lines.append(
+                f'edpr_requests_total{{endpoint="{_label(endpoint)}"}} '
+                f'{s.requests}')
+
+        lines.extend([
+            '# HELP edpr_request_errors_total Requests that failed.',
+            '# TYPE edpr_request_errors_total counter',
+        ])
+        for endpoint, s in stats:
+            lines.append(
+                f'edpr_request_errors_total{{endpoint="{_label(endpoint)}"}} '
+                f'{s.errors}')
+
+        lines.extend([
+            '# HELP edpr_request_duration_seconds Request latency.',
+            '# TYPE edpr_request_duration_seconds histogram',
+        ])
+        for endpoint, s in stats:
+            label = f'endpoint="{_label(endpoint)}"'
+            for bound, count in zip(BUCKETS, s.buckets):
+                lines.append(
+                    f'edpr_request_duration_seconds_bucket'
+                    f'{{{label},le="{bound}"}} {count}')
+            lines.append(
+                f'edpr_request_duration_seconds_bucket{{{label},le="+Inf"}} '
+                f'{s.requests}')
+            lines.append(
+                f'edpr_request_duration_seconds_sum{{{label}}} {s.seconds}')
+            lines.append(
+                f'edpr_request_duration_seconds_count{{{label}}} '
+                f'{s.requests}')
+
+        lines.extend([
+            '# HELP edpr_sql_queries_total SQL statements executed.',
+            '# TYPE edpr_sql_queries_total counter',
+        ])
+        for endpoint, s in stats:
+            lines.append(
+                f'edpr_sql_queries_total{{endpoint="{_label(endpoint)}"}} '
+                f'{s.queries}')
+
+        lines.extend([
+            '# HELP edpr_sql_seconds_total Time spent executing SQL.',
+            '# TYPE edpr_sql_seconds_total counter',
+        ])
+        for endpoint, s in stats:
+            lines.append(
+                f'edpr_sql_seconds_total{{endpoint="{_label(endpoint)}"}} '
+                f'{s.db_seconds}')
+    return '\n'.join(lines) + '\n'
+
+
+def serve_metrics():
+    return render(), 200, {
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+def init_app(app: Flask):
+    if not app.config['METRICS']:
+        return
+    if not event.contains(Engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    request_started.connect(_request_started, app)
+    request_finished.connect(_request_finished, app)
+    got_request_exception.connect(_request_exception, app)
+    app.add_url_rule('/api/metrics', view_func=serve_metrics)
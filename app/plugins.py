@@ -1,16 +1,15 @@
 import zipfile
+import zlib
 import yaml
 import re
-import os
-import os.path
 import json
-import qrcode
-import qrcode.image.svg
-import shutil
+import hashlib
+import uuid
 from flask import (
     Blueprint, url_for, redirect, render_template, g,
-    current_app, flash, request, abort, send_file,
+    current_app, flash, request, abort, make_response,
 )
+from werkzeug.security import safe_join
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileRequired
 from wtforms.validators import ValidationError
@@ -18,26 +17,51 @@ import wtforms.fields as wtf
 import wtforms.validators as wtv
 from typing import BinaryIO
 from sqlalchemy import func
-from sqlalchemy.exc import NoResultFound, IntegrityError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import lazyload, selectinload
 from .auth import login_required, get_user
-from .database import db, Plugin, PluginVersion
+from .database import (
+    db, User, Plugin, PluginVersion, PluginChange, Job, plugins_page,
+)
+from . import (
+    catalog, deltas, downloads, fragments, icons, jobs, qr, storage,
+    search as search_index,
+)
+from .markup import render_markdown
+from .conditional import conditional, catalog_validator, plugin_validator
 from importlib.resources import read_text
 
 
 bp = Blueprint('plugins', __name__)
 countries = json.loads(read_text('app', 'countries.json'))
+CHUNK_SIZE = 64 * 1024
+PAGE_SIZE = 50
+MAX_METADATA_SIZE = 1024 * 1024
 FORBIDDEN_NAMES = [
     'my', 'search', 'nav', 'upload', 'edit', 'delete', 'icon',
     'login', 'auth', 'logout', 'api',
 ]
+# Rows of plugin lists are mostly fragment cache hits, so versions are
+# loaded only for the rows that are rendered.
+LIST_OPTIONS = (
+    selectinload(Plugin.created_by),
+    lazyload(Plugin.last_version), lazyload(Plugin.last_eversion),
+)
 
 
 @bp.route('/', endpoint='list')
+@conditional(catalog_validator)
 @get_user
 def plugins_list():
-    plugins = db.session.scalars(db.select(Plugin).order_by(Plugin.title))
-    plugins = [p for p in plugins if p.last_version]
-    return render_template('plugins.html', plugins=plugins, mine=False)
+    try:
+        plugins, next_cursor = plugins_page(
+            db.select(Plugin).where(Plugin.last_version_pk.is_not(None))
+            .options(*LIST_OPTIONS),
+            request.args.get('after'), PAGE_SIZE)
+    except ValueError as e:
+        return abort(400, str(e))
+    return render_template('plugins.html', plugins=plugins, mine=False,
+                           next_cursor=next_cursor)
 
 
 @bp.route('/my', endpoint='my')
@@ -45,7 +69,8 @@ def plugins_list():
 @login_required
 def plugins_mine():
     plugins = db.session.scalars(db.select(Plugin).where(
-        Plugin.created_by == g.user).order_by(Plugin.title))
+        Plugin.created_by == g.user).order_by(Plugin.title)
+        .options(*LIST_OPTIONS))
     return render_template('plugins.html', plugins=plugins, mine=True)
 
 
@@ -55,10 +80,11 @@ def search():
     value = request.args.get('q', '').strip()
     if not value:
         return plugins_list()
-    plugins = db.session.scalars(db.select(Plugin).where(
-        Plugin.title.like(f'%{value}%')).order_by(Plugin.title))
+    page = request.args.get('page', 1, type=int)
+    plugins, more = search_index.search(
+        value, page, q_filter=lambda q: q.options(*LIST_OPTIONS))
     return render_template('plugins.html', plugins=plugins,
-                           mine=False, search=value)
+                           mine=False, search=value, page=page, more=more)
 
 
 def validate_country(form, field):
@@ -74,7 +100,68 @@ class UploadForm(FlaskForm):
     package = FileField('EDP Package', validators=[FileRequired()])
 
 
-def unpack_edp(package: BinaryIO) -> dict:
+def check_members(pkg: zipfile.ZipFile, max_file: int, max_total: int,
+                  max_ratio: float):
+    """Decompresses the archive chunk by chunk to verify checksums,
+    failing before doing any work when the sizes in the directory
+    exceed the limits. Reading never returns more than the declared
+    size, so the work is bounded by the limits."""
+    infos = pkg.infolist()
+    total = 0
+    for info in infos:
+        if info.file_size > max_file:
+            raise ValidationError(
+                f'File {info.filename} is larger than {max_file} bytes')
+        # Small files can have huge ratios legitimately, like empty lines.
+        if (info.file_size > 65536 and
+                info.file_size > info.compress_size * max_ratio):
+            raise ValidationError(
+                f'File {info.filename} is compressed suspiciously well')
+        total += info.file_size
+        if total > max_total:
+            raise ValidationError(
+                f'Unpacked package is larger than {max_total} bytes')
+
+    for info in infos:
+        if info.is_dir():
+            continue
+        try:
+            with pkg.open(info) as f:
+                while f.read(CHUNK_SIZE):
+                    pass
+        except (zipfile.BadZipFile, zlib.error, OSError, EOFError,
+                NotImplementedError, RuntimeError) as e:
+            raise ValidationError(f'Bad zip file: {info.filename}: {e}')
+
+
+def store_package(package: BinaryIO) -> str:
+    """Saves the package under its SHA-256 digest, unless a file with
+    the same contents is already stored. Returns the digest."""
+    digest = hashlib.sha256()
+    package.seek(0)
+    while chunk := package.read(CHUNK_SIZE):
+        digest.update(chunk)
+    sha256 = digest.hexdigest()
+
+    key = PluginVersion.package_key(sha256)
+    if not storage.get().exists(key):
+        package.seek(0)
+        storage.get().save(key, package)
+    package.seek(0)
+    return sha256
+
+
+def remove_unused_packages(shas: set[str | None]):
+    """Deletes stored packages no version refers to anymore."""
+    for sha256 in shas:
+        if sha256 and not db.session.scalar(
+                db.select(func.count(PluginVersion.pk))
+                .where(PluginVersion.sha256 == sha256)):
+            storage.get().delete(PluginVersion.package_key(sha256))
+            deltas.remove_deltas(sha256)
+
+
+def open_package(package: BinaryIO) -> zipfile.ZipFile:
     maxsize = current_app.config['MAX_CONTENT_LENGTH']
     package_size = package.seek(0, 2)
     package.seek(0)
@@ -82,17 +169,58 @@ def unpack_edp(package: BinaryIO) -> dict:
         raise ValidationError('File is too big')
 
     try:
-        pkg = zipfile.ZipFile(package, mode='r')
+        return zipfile.ZipFile(package, mode='r')
     except Exception as e:
         raise ValidationError(f'Cannot unzip the package: {e}')
 
+
+def read_metadata(pkg: zipfile.ZipFile) -> dict:
+    """Reads and checks plugin.yaml. Does not look at other files."""
     try:
-        test_result = pkg.testzip()
-        if test_result:
-            try:
-                raise ValidationError(f'Bad zip file: {test_result}')
-            except UnicodeDecodeError:
-                raise ValidationError('Bad zip file, maybe charset issue')
+        info = pkg.getinfo('plugin.yaml')
+    except KeyError:
+        raise ValidationError('Missing plugin.yaml file')
+    if info.file_size > MAX_METADATA_SIZE:
+        raise ValidationError('File plugin.yaml is too big')
+
+    try:
+        content = pkg.read(info).decode('utf8')
+        metadata = yaml.safe_load(content)
+    except Exception as e:
+        raise ValidationError(
+            f'Error loading plugin.yaml, must be broken: {e}')
+
+    if not isinstance(metadata, dict):
+        raise ValidationError('plugin.yaml should contain a dictionary')
+
+    req_keys = ('id', 'name', 'version', 'description')
+    for k in req_keys:
+        if k not in metadata:
+            raise ValidationError(f'Key "{k}" is missing in the metadata')
+
+    if not isinstance(metadata['id'], str) or not re.match(
+            r'^[a-zA-Z0-9][a-zA-Z0-9_-]+$', metadata['id']):
+        raise ValidationError(
+            'Plugin id must be of latin letters, numbers, '
+            'dashes, or underscores.')
+
+    if metadata['id'] in FORBIDDEN_NAMES:
+        raise ValidationError(
+            f'Plugin id is a reserved word: {metadata["id"]}')
+
+    return metadata
+
+
+def unpack_edp(package: BinaryIO) -> dict:
+    pkg = open_package(package)
+    try:
+        config = current_app.config
+        check_members(
+            pkg,
+            max_file=config['MAX_UNPACKED_FILE_MB'] * 1024 * 1024,
+            max_total=config['MAX_UNPACKED_SIZE_MB'] * 1024 * 1024,
+            max_ratio=config['MAX_COMPRESSION_RATIO'],
+        )
 
         namelist = pkg.namelist()
         for name in namelist:
@@ -100,18 +228,7 @@ def unpack_edp(package: BinaryIO) -> dict:
                 raise ValidationError(
                     f'Found "{name}" in zip file, which is wrong')
 
-        if 'plugin.yaml' not in namelist:
-            raise ValidationError('Missing plugin.yaml file')
-
-        try:
-            content = pkg.read('plugin.yaml').decode('utf8')
-            metadata = yaml.safe_load(content)
-        except Exception as e:
-            raise ValidationError(
-                f'Error loading plugin.yaml, must be broken: {e}')
-
-        if not isinstance(metadata, dict):
-            raise ValidationError('plugin.yaml should contain a dictionary')
+        metadata = read_metadata(pkg)
 
         if 'icon' in metadata:
             icon_file = f'icons/{metadata["icon"]}'
@@ -135,21 +252,142 @@ def unpack_edp(package: BinaryIO) -> dict:
         pkg.close()
         package.seek(0)
 
-    req_keys = ('id', 'name', 'version', 'description')
-    for k in req_keys:
-        if k not in metadata:
-            raise ValidationError(f'Key "{k}" is missing in the metadata')
+    return metadata
 
-    if not re.match(r'^[a-zA-Z0-9][a-zA-Z0-9_-]+$', metadata['id']):
-        raise ValidationError(
-            'Plugin id must be of latin letters, numbers, '
-            'dashes, or underscores.')
 
-    if metadata['id'] in FORBIDDEN_NAMES:
+def check_upload(metadata: dict, user: User) -> int:
+    """Checks that the user can upload this version of the plugin.
+    Returns the parsed version."""
+    try:
+        version = PluginVersion.parse_version(metadata['version'])
+    except ValueError as e:
+        raise ValidationError(f'Wrong version {metadata["version"]}: {e}')
+    plugin = db.session.get(Plugin, metadata['id'])
+    if plugin and plugin.created_by != user:
+        raise ValidationError('No permission to update')
+    if db.session.scalar(
+            db.select(func.count(PluginVersion.pk))
+            .where(PluginVersion.plugin_id == metadata['id'])
+            .where(PluginVersion.version >= version)) > 0:
         raise ValidationError(
-            f'Plugin id is a reserved word: {metadata["id"]}')
+            f'Version {metadata["version"]} or higher already exists.')
+    return version
+
+
+def add_version(package: BinaryIO, user: User) -> Plugin:
+    """Validates the package and publishes it as a new version.
+    Commits the session."""
+    metadata = unpack_edp(package)
+    version = check_upload(metadata, user)
+
+    plugin_id = metadata['id']
+    data = {
+        'id': plugin_id,
+        'title': metadata['name'],
+        'description': metadata['description'],
+        'description_html': render_markdown(metadata['description']),
+        'created_by': user,
+        'homepage': metadata.get('homepage'),
+        'country': metadata.get('country'),
+        'icon': metadata.get('icon_ext'),
+    }
+    if data['country'] and data['country'] not in countries:
+        raise ValidationError(
+            f'{data["country"]} is not a correct country identifier')
+
+    plugin = db.session.get(Plugin, plugin_id)
+    old_icon = None
+    if plugin:
+        old_icon = (plugin.icon_hash, plugin.icon)
+        plugin.title = data['title']
+        plugin.description = data['description']
+        plugin.description_html = data['description_html']
+        plugin.homepage = data['homepage']
+        plugin.icon = data['icon']
+        plugin.icon_hash = None
+        plugin.icon_thumbnails = False
+        plugin.bump_revision()
+    else:
+        if db.session.scalar(
+                db.select(func.count(Plugin.id))
+                .where(Plugin.title == data['title'])) > 0:
+            raise ValidationError(
+                f'A plugin with the title "{data["title"]}" '
+                'but a different id already exists.')
+        plugin = Plugin(**data)
+        db.session.add(plugin)
+
+    version = PluginVersion(
+        plugin_id=plugin.id,
+        plugin=plugin,
+        version=version,
+        created_by=user,
+        experimental=metadata.get('experimental', True),
+    )
+    db.session.add(version)
+    plugin.update_stats()
+    search_index.update_plugin(plugin)
+
+    # Copy the file
+    version.sha256 = store_package(package)
+    # And the icon
+    if plugin.icon and 'icon_data' in metadata:
+        plugin.icon_hash, plugin.icon_thumbnails = icons.store_icon(
+            metadata['icon_data'], plugin.icon)
+
+    PluginChange.record(plugin.id)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Unique indexes catch uploads that raced past the checks above.
+        db.session.rollback()
+        raise ValidationError(
+            'The plugin was changed during the upload, please try again.')
+    catalog.invalidate()
+    fragments.invalidate(plugin.id)
+    if old_icon:
+        icons.remove_unused_icon(*old_icon)
+    return plugin
+
+
+def queue_upload(package: BinaryIO, user: User) -> Job:
+    """Does quick checks, saves the package, and queues the rest of
+    the work for the background worker."""
+    pkg = open_package(package)
+    try:
+        metadata = read_metadata(pkg)
+    finally:
+        pkg.close()
+    check_upload(metadata, user)
 
-    return metadata
+    # Saved to the storage, since the worker can be on another server.
+    name = f'{uuid.uuid4().hex}.edp'
+    package.seek(0)
+    storage.get().save(f'incoming/{name}', package)
+
+    job = jobs.enqueue('upload', user, plugin_id=metadata['id'],
+                       package=name, version=str(metadata['version']))
+    db.session.commit()
+    return job
+
+
+@jobs.handler('upload')
+def process_upload(job: Job):
+    key = f'incoming/{job.payload["package"]}'
+    try:
+        with storage.get().open(key) as f:
+            add_version(f, job.created_by)
+    except ValidationError as e:
+        raise jobs.JobFailed(str(e))
+    except IntegrityError as e:
+        raise jobs.JobFailed(str(e))
+    except OSError as e:
+        raise jobs.JobFailed(f'Error copying the file: {e}')
+    finally:
+        try:
+            storage.get().delete(key)
+        except OSError:
+            pass
 
 
 @bp.route('/upload', methods=['GET', 'POST'])
@@ -160,69 +398,14 @@ def upload():
     if form.validate_on_submit():
         # Uploading a package, finally
         try:
-            metadata = unpack_edp(form.package.data)
-
-            plugin_id = metadata['id']
-            version = PluginVersion.parse_version(metadata['version'])
-            if db.session.scalar(
-                    db.select(func.count(PluginVersion.pk))
-                    .where(PluginVersion.plugin_id == plugin_id)
-                    .where(PluginVersion.version >= version)) > 0:
-                raise ValidationError(
-                    f'Version {metadata["version"]} or higher already exists.')
-
-            data = {
-                'id': plugin_id,
-                'title': metadata['name'],
-                'description': metadata['description'],
-                'created_by': g.user,
-                'homepage': metadata.get('homepage'),
-                'country': metadata.get('country'),
-                'icon': metadata.get('icon_ext'),
-            }
-            if data['country']:
-                validate_country(data['country'])
-
-            try:
-                plugin = db.session.get_one(Plugin, plugin_id)
-                if plugin.created_by != g.user:
-                    raise ValidationError('No permission to update')
-                plugin.title = data['title']
-                plugin.description = data['description']
-                plugin.homepage = data['homepage']
-                plugin.icon = data['icon']
-            except NoResultFound:
-                if db.session.scalar(
-                        db.select(func.count(Plugin.id))
-                        .where(Plugin.title == data['title'])) > 0:
-                    raise ValidationError(
-                        f'A plugin with the title "{data["title"]}" '
-                        'but a different id already exists.')
-                plugin = Plugin(**data)
-                db.session.add(plugin)
-
-            version = PluginVersion(
-                plugin_id=plugin.id,
-                plugin=plugin,
-                version=version,
-                created_by=g.user,
-                experimental=metadata.get('experimental', True),
-            )
-            db.session.add(version)
-
-            # Copy the file
-            path = version.filename
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            form.package.data.save(path)
-            # And the icon
-            icon_file = plugin.icon_file
-            if icon_file and 'icon_data' in metadata:
-                with open(icon_file, 'wb') as f:
-                    f.write(metadata['icon_data'])
-
-            db.session.commit()
-
-            return redirect(url_for('plugins.plugin', name=plugin_id))
+            package = form.package.data.stream
+            if jobs.enabled():
+                job = queue_upload(package, g.user)
+                if db.session.get(Plugin, job.plugin_id):
+                    return redirect(url_for('.plugin', name=job.plugin_id))
+                return redirect(url_for('.upload_status', job_id=job.id))
+            plugin = add_version(package, g.user)
+            return redirect(url_for('plugins.plugin', name=plugin.id))
         except ValidationError as e:
             flash(e)
         except IntegrityError as e:
@@ -232,6 +415,18 @@ def upload():
     return render_template('upload.html', form=form)
 
 
+@bp.route('/upload/<int:job_id>')
+@get_user
+@login_required
+def upload_status(job_id: int):
+    job: Job = db.get_or_404(Job, job_id)
+    if job.created_by != g.user:
+        return abort(403)
+    if job.status == 'done' and job.plugin_id:
+        return redirect(url_for('.plugin', name=job.plugin_id))
+    return render_template('job.html', job=job)
+
+
 class PluginForm(FlaskForm):
     title = wtf.StringField(
         validators=[wtv.DataRequired(), wtv.Length(max=250)])
@@ -254,10 +449,16 @@ def edit_plugin(name: str):
     if form.validate_on_submit():
         plugin.title = form.title.data
         plugin.description = form.description.data
+        plugin.description_html = render_markdown(plugin.description)
         plugin.homepage = form.homepage.data or None
         plugin.hidden = form.hidden.data
         plugin.country = form.country.data or None
+        search_index.update_plugin(plugin)
+        plugin.bump_revision()
+        PluginChange.record(plugin.id)
         db.session.commit()
+        catalog.invalidate()
+        fragments.invalidate(name)
         return redirect(url_for('.plugin', name=name))
     return render_template('edit_plugin.html', plugin=plugin, form=form)
 
@@ -288,7 +489,12 @@ def edit_version(name: str, version: str):
     form = VersionForm(obj=vobj)
     if form.validate_on_submit():
         vobj.changelog = form.changelog.data
+        vobj.changelog_html = render_markdown(vobj.changelog)
+        search_index.update_plugin(plugin)
+        plugin.bump_revision()
+        PluginChange.record(plugin.id)
         db.session.commit()
+        fragments.invalidate(name)
         return redirect(url_for('.plugin', name=name))
     return render_template(
         'edit_version.html', plugin=plugin, version=vobj, form=form)
@@ -320,19 +526,29 @@ def delete_something(name: str, version: str | None = None):
     if request.method == 'POST':
         if request.form.get('really_delete') != '1':
             return redirect(url_for('.plugin', name=name))
+        shas = {v.sha256 for v in ([vobj] if vobj else plugin.versions)}
+        icon = (plugin.icon_hash, plugin.icon)
         db.session.delete(vobj or plugin)
+        if vobj:
+            plugin.update_stats()
+            plugin.bump_revision()
+            search_index.update_plugin(plugin)
+        else:
+            search_index.remove_plugin(name)
+        PluginChange.record(name, deleted=not vobj)
         db.session.commit()
+        catalog.invalidate()
+        fragments.invalidate(name)
 
         # Delete files
         try:
+            remove_unused_packages(shas)
             if vobj:
-                os.remove(vobj.filename)
+                if not vobj.sha256:
+                    storage.get().delete(vobj.file_key)
             else:
-                shutil.rmtree(
-                    os.path.join(
-                        current_app.instance_path, 'plugins', name),
-                    ignore_errors=True,
-                )
+                storage.get().delete_prefix(f'plugins/{name}/')
+                icons.remove_unused_icon(*icon)
         except IOError:
             # Oh well
             pass
@@ -345,6 +561,7 @@ def delete_something(name: str, version: str | None = None):
 
 
 @bp.route('/i/<name>')
+@conditional(plugin_validator)
 def install(name: str):
     url = request.args.get('url')
     if not url:
@@ -353,16 +570,21 @@ def install(name: str):
         flash(f'URL {url} does not seem to point to an EDP file.')
         return redirect(url_for('.list'))
 
-    qr = qrcode.make(
-        url, image_factory=qrcode.image.svg.SvgPathImage,
-        border=1, box_size=20
-    )
     plugin = db.session.scalars(
         db.select(Plugin).where(Plugin.id == name).limit(1)
     ).one_or_none()
     return render_template(
         'install.html', name=name, url=url, plugin=plugin,
-        qrcode=qr.to_string().decode())
+        qrcode=qr.render_svg(url, persist=False))
+
+
+def count_download(resp, vobj: PluginVersion):
+    # Do not count revalidations and resumed downloads. Redirects to
+    # the storage are counted, since the app does not see the rest.
+    if resp.status_code in (200, 302) or (
+            resp.status_code == 206 and request.range and
+            request.range.ranges[0][0] == 0):
+        downloads.record(vobj)
 
 
 @bp.route('/<name>.edp')
@@ -386,43 +608,117 @@ def download(name: str, version: str | None = None):
             vobj = plugin.last_eversion
     if vobj is None:
         return abort(404, f'Version {version} not found.')
-    vobj.downloads += 1
-    db.session.commit()
-    path = vobj.filename
-    return send_file(
-        path, mimetype='application/x.edp+zip',
+    resp = storage.get().send(
+        vobj.file_key, mimetype='application/x.edp+zip',
         download_name=f'{name}.v{vobj.version_str}.edp',
-        as_attachment=True,
+        as_attachment=True, etag=vobj.sha256 or True,
+    )
+    count_download(resp, vobj)
+    return resp
+
+
+@bp.route('/<name>.v<from_version>-v<version>.edpdelta')
+def download_delta(name: str, from_version: str, version: str):
+    """Sends the changes between two versions, see deltas.py, or the
+    newer package when the changes are not smaller."""
+    try:
+        numbers = [PluginVersion.parse_version(v)
+                   for v in (from_version, version)]
+    except ValueError:
+        return abort(404, 'Incorrect version')
+    found = {v.version: v for v in db.session.scalars(
+        db.select(PluginVersion)
+        .where(PluginVersion.plugin_id == name)
+        .where(PluginVersion.version.in_(numbers))
+    )}
+    old, new = found.get(numbers[0]), found.get(numbers[1])
+    if old is None or new is None or old.version >= new.version:
+        return abort(404, 'Versions not found')
+    if not old.sha256 or not new.sha256:
+        return abort(404, 'No delta for these versions')
+    try:
+        key = deltas.get_delta(old, new)
+    except FileNotFoundError:
+        return abort(404, 'Package not found')
+    if key is None:
+        resp = storage.get().send(
+            new.file_key, mimetype='application/x.edp+zip',
+            download_name=f'{name}.v{new.version_str}.edp',
+            as_attachment=True, etag=new.sha256,
+        )
+        count_download(resp, new)
+        return resp
+    resp = storage.get().send(
+        key, mimetype='application/x.edpdelta+zip',
+        download_name=f'{name}.v{old.version_str}-v{new.version_str}'
+                      '.edpdelta',
+        as_attachment=True, etag=f'{old.sha256[:32]}-{new.sha256[:32]}',
     )
+    count_download(resp, new)
+    return resp
 
 
 @bp.route('/icon/<name>')
 @bp.route('/icon/<name>.<ext>')
 def icon(name: str, ext: str | None = None):
     plugin = db.get_or_404(Plugin, name)
-    icon_file = plugin.icon_file
-    if not icon_file:
+    icon_key = plugin.icon_key
+    if not icon_key or not plugin.icon:
         return abort(404, 'The plugin has no icon')
     if ext and plugin.icon != ext.lower():
         return abort(415, f'Incorrect extension, expected {plugin.icon}')
-    mime = {
-        'svg': 'image/svg+xml',
-        'png': 'image/png',
-        'gif': 'image/gif',
-        'webp': 'image/webp',
-    }
-    return send_file(
-        icon_file, mimetype=mime.get(icon_file.rsplit('.', 1)[-1]))
+    return storage.get().send(
+        icon_key, mimetype=icons.MIME_TYPES.get(plugin.icon))
+
+
+@bp.route('/icon/h/<filename>')
+def hashed_icon(filename: str):
+    key = safe_join('icons', filename)
+    if not key or not storage.get().exists(key):
+        return abort(404)
+    resp = storage.get().send(
+        key, mimetype=icons.MIME_TYPES.get(filename.rsplit('.', 1)[-1]))
+    if resp.status_code == 302:
+        # Presigned URLs expire.
+        return resp
+    # The name changes with the contents, so this can be cached forever.
+    resp.cache_control.no_cache = None
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 365 * 24 * 3600
+    resp.cache_control.immutable = True
+    return resp
 
 
 @bp.route('/<name>')
+@conditional(plugin_validator)
 @get_user
 def plugin(name: str):
-    plugin = db.get_or_404(Plugin, name)
+    # The page does not show latest versions, and on a fragment cache
+    # hit it needs nothing but the plugin row.
+    plugin = db.get_or_404(Plugin, name, options=[
+        lazyload(Plugin.last_version), lazyload(Plugin.last_eversion)])
+    mine = g.user is not None and g.user.osm_id == plugin.created_by_id
+    uploads = []
+    if mine:
+        # Uploads still in the queue, or failed.
+        uploads = list(db.session.scalars(
+            db.select(Job)
+            .where(Job.plugin_id == name, Job.kind == 'upload',
+                   Job.status != 'done')
+            .order_by(Job.id.desc()).limit(5)))
+    return render_template('plugin.html', plugin=plugin, mine=mine,
+                           uploads=uploads)
+
+
+# Under /api, so that it does not depend on reserved plugin ids.
+@bp.route('/api/qr/<name>.svg')
+def qrcode(name: str):
+    if not db.session.get(Plugin, name):
+        return abort(404)
     plugin_url = url_for('.install', name=name, _external=True)
-    qr = qrcode.make(
-        plugin_url, image_factory=qrcode.image.svg.SvgPathImage,
-        border=1, box_size=20
-    )
-    return render_template(
-        'plugin.html', plugin=plugin, qrcode=qr.to_string().decode())
+    resp = make_response(qr.render_svg(plugin_url))
+    resp.mimetype = 'image/svg+xml'
+    resp.set_etag(qr.cache_key(plugin_url))
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 30 * 24 * 3600
+    return resp.make_conditional(request)
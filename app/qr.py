@@ -0,0 +1,69 @@
+"""Cached QR code rendering.
+
+A QR code for a given URL never changes, so the SVG is rendered once
+and kept in a bounded in-memory LRU, and optionally on disk under
+instance/qr, so that other workers and restarts can reuse it.
+"""
+import os
+import os.path
+import hashlib
+import threading
+import qrcode
+import qrcode.image.svg
+from collections import OrderedDict
+from flask import current_app
+
+
+BORDER = 1
+BOX_SIZE = 20
+MAX_CACHED = 256
+
+_lock = threading.Lock()
+_cache: OrderedDict[str, str] = OrderedDict()
+
+
+def cache_key(data: str) -> str:
+    return hashlib.sha256(
+        f'{data}\0{BORDER}\0{BOX_SIZE}'.encode()).hexdigest()
+
+
+def _render(data: str) -> str:
+    qr = qrcode.make(
+        data, image_factory=qrcode.image.svg.SvgPathImage,
+        border=BORDER, box_size=BOX_SIZE
+    )
+    return qr.to_string().decode()
+
+
+def render_svg(data: str, persist: bool = True) -> str:
+    """Returns an SVG QR code for the data. Set persist to False for
+    user-supplied data, so that it does not fill the disk."""
+    key = cache_key(data)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    path = os.path.join(current_app.instance_path, 'qr', f'{key}.svg')
+    svg: str | None = None
+    if persist:
+        try:
+            with open(path, 'r') as f:
+                svg = f.read()
+        except OSError:
+            pass
+
+    if svg is None:
+        svg = _render(data)
+        if persist:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}'
+            with open(tmp_path, 'w') as f:
+                f.write(svg)
+            os.replace(tmp_path, path)
+
+    with _lock:
+        _cache[key] = svg
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+    return svg
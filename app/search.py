@@ -0,0 +1,129 @@
+"""Full-text search over plugins.
+
+On SQLite, the index is an FTS5 virtual table, on PostgreSQL a table
+with a weighted tsvector and a GIN index. Both are named plugin_search
+and are created by a migration. Other backends fall back to LIKE.
+
+Titles weigh more than descriptions, which weigh more than author
+names and changelogs.
+"""
+import re
+import click
+from flask.cli import with_appcontext
+import sqlalchemy as sa
+from sqlalchemy.sql import Select
+from .database import db, Plugin, PluginVersion
+
+
+search_table = sa.table(
+    'plugin_search', sa.column('plugin_id'), sa.column('title'),
+    sa.column('description'), sa.column('author'), sa.column('changelogs'),
+    sa.column('document'),
+)
+
+
+def _dialect() -> str:
+    return db.session.get_bind().dialect.name
+
+
+def remove_plugin(plugin_id: str):
+    if _dialect() in ('sqlite', 'postgresql'):
+        db.session.execute(sa.delete(search_table).where(
+            search_table.c.plugin_id == plugin_id))
+
+
+def update_plugin(plugin: Plugin):
+    """Rebuilds the index entry for the plugin. Call this after
+    changing the plugin or its versions, before committing."""
+    dialect = _dialect()
+    if dialect not in ('sqlite', 'postgresql'):
+        return
+    db.session.flush()
+    remove_plugin(plugin.id)
+    changelogs = '\n'.join(db.session.scalars(
+        db.select(PluginVersion.changelog)
+        .where(PluginVersion.plugin_id == plugin.id)
+        .where(PluginVersion.changelog.is_not(None))
+    ))
+    author = plugin.created_by.name
+    if dialect == 'sqlite':
+        db.session.execute(sa.insert(search_table).values(
+            plugin_id=plugin.id, title=plugin.title,
+            description=plugin.description, author=author,
+            changelogs=changelogs,
+        ))
+    else:
+        def weighted(value: str, weight: str):
+            return sa.func.setweight(
+                sa.func.to_tsvector('simple', value), weight)
+
+        db.session.execute(sa.insert(search_table).values(
+            plugin_id=plugin.id,
+            document=(
+                weighted(plugin.title, 'A')
+                .op('||')(weighted(plugin.description, 'B'))
+                .op('||')(weighted(author, 'C'))
+                .op('||')(weighted(changelogs, 'D'))
+            ),
+        ))
+
+
+def search_query(value: str) -> Select | None:
+    """Returns a ranked select of plugins matching the value,
+    or None when there is nothing to search for."""
+    words = re.findall(r'\w+', value)
+    if not words:
+        return None
+    dialect = _dialect()
+    q = db.select(Plugin)
+    if dialect == 'sqlite':
+        # Quoting every word avoids FTS syntax errors from user input.
+        terms = ' '.join(f'"{w}"*' for w in words)
+        table: sa.ColumnClause[str] = sa.literal_column('plugin_search')
+        return (
+            q.join(search_table, search_table.c.plugin_id == Plugin.id)
+            .where(table.match(terms))
+            .order_by(sa.func.bm25(table, 0, 10.0, 4.0, 2.0, 1.0),
+                      Plugin.title)
+        )
+    if dialect == 'postgresql':
+        tsquery = sa.func.websearch_to_tsquery('simple', value)
+        document = search_table.c.document
+        return (
+            q.join(search_table, search_table.c.plugin_id == Plugin.id)
+            .where(document.op('@@')(tsquery))
+            .order_by(sa.func.ts_rank(document, tsquery).desc(),
+                      Plugin.title)
+        )
+    like = f'%{value}%'
+    return q.where(sa.or_(
+        Plugin.title.like(like), Plugin.description.like(like)
+    )).order_by(Plugin.title)
+
+
+def search(value: str, page: int = 1, per_page: int = 50,
+           q_filter=None) -> tuple[list[Plugin], bool]:
+    """Returns a page of found plugins and whether there are more."""
+    q = search_query(value)
+    if q is None:
+        return [], False
+    if q_filter is not None:
+        q = q_filter(q)
+    q = q.offset((max(page, 1) - 1) * per_page).limit(per_page + 1)
+    plugins = list(db.session.scalars(q))
+    return plugins[:per_page], len(plugins) > per_page
+
+
+@click.command('reindex')
+@with_appcontext
+def reindex_command():
+    """Rebuilds the full-text search index."""
+    plugins = list(db.session.scalars(db.select(Plugin)))
+    for plugin in plugins:
+        update_plugin(plugin)
+    db.session.commit()
+    click.echo(f'Indexed {len(plugins)} plugins.')
+
+
+def init_app(app):
+    app.cli.add_command(reindex_command)
@@ -0,0 +1,131 @@
+"""SQLite settings for running with several gunicorn workers.
+
+With SQLITE_PRODUCTION enabled (the default) and an SQLite database,
+connections switch the database to WAL, so that readers and the writer
+do not block each other, and wait for locks instead of failing with
+"database is locked".
+
+Write transactions start with BEGIN IMMEDIATE. With the default
+deferred BEGIN, a transaction that read first and then tries to write
+can fail at once when another connection writes, and the busy timeout
+does not help. Since that would also make every page view take the
+write lock, SELECT statements go to a second, read-only engine until
+the transaction writes something. Most GET requests never touch the
+writable connections at all.
+"""
+import sqlite3
+from urllib.parse import quote
+from flask import Flask, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.sql import Select
+
+
+PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 10000,
+    'cache_size': -32000,  # in KiB
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+# Only one connection can write at a time, so waiting for the pool
+# is as good as waiting for the lock, and cheaper.
+WRITE_POOL = {'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 30}
+READ_POOL = {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30}
+
+
+def _is_file_database(uri: str) -> bool:
+    url = make_url(uri)
+    return (url.get_backend_name() == 'sqlite' and
+            url.database not in (None, '', ':memory:') and
+            not url.database.startswith('file:'))
+
+
+def enabled(app: Flask) -> bool:
+    return (app.config['SQLITE_PRODUCTION'] and
+            _is_file_database(app.config['SQLALCHEMY_DATABASE_URI']))
+
+
+def set_engine_options(app: Flask):
+    """Sets pool sizes. Must be called before db.init_app()."""
+    if enabled(app):
+        options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        for k, v in WRITE_POOL.items():
+            options.setdefault(k, v)
+
+
+def _set_pragmas(dbapi_conn: sqlite3.Connection, journal: bool):
+    cursor = dbapi_conn.cursor()
+    if journal:
+        cursor.execute('PRAGMA journal_mode=WAL')
+    for k, v in PRAGMAS.items():
+        cursor.execute(f'PRAGMA {k}={v}')
+    cursor.close()
+
+
+def _on_write_connect(dbapi_conn, connection_record):
+    _set_pragmas(dbapi_conn, journal=True)
+    # Let SQLAlchemy emit BEGIN itself, see _on_write_begin.
+    dbapi_conn.isolation_level = None
+
+
+def _on_write_begin(conn):
+    conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def _on_read_connect(dbapi_conn, connection_record):
+    _set_pragmas(dbapi_conn, journal=False)
+
+
+def init_app(app: Flask):
+    """Sets up the engines. Must be called after db.init_app()."""
+    if not enabled(app):
+        return
+    from .database import db
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'connect', _on_write_connect)
+    event.listen(engine, 'begin', _on_write_begin)
+
+    # Read-only connections cannot switch to WAL, but the journal mode
+    # is stored in the file, so the first writable connection does it.
+    database = engine.url.database
+    assert database, 'enabled() allows only file databases'
+    url = engine.url.set(
+        database=f'file:{quote(database)}',
+        query={'mode': 'ro', 'uri': 'true'},
+    )
+    read_engine = create_engine(url, **READ_POOL)
+    event.listen(read_engine, 'connect', _on_read_connect)
+    app.extensions['sqlite_read_engines'] = {engine: read_engine}
+
+
+class RoutingSession(Session):
+    """Sends SELECT statements to a read-only engine, when there is
+    one, until the transaction writes something."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wrote = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None,
+                 **kwargs) -> Engine | Connection:
+        engine = super().get_bind(
+            mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not isinstance(engine, Engine):
+            return engine
+        if self._flushing or (
+                clause is not None and not isinstance(clause, Select)):
+            self._wrote = True
+        elif isinstance(clause, Select) and not self._wrote:
+            read_engines = current_app.extensions.get(
+                'sqlite_read_engines', {})
+            return read_engines.get(engine, engine)
+        return engine
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session._wrote = False
@@ -0,0 +1,263 @@
+"""Storage for packages, icons and uploads waiting for the worker.
+
+Files are addressed by keys like "packages/ab/<sha256>.edp". By
+default they are files under the instance directory. With STORAGE set
+to 's3', they are objects in S3_BUCKET (under S3_PREFIX) on S3 or a
+compatible service like MinIO, set S3_ENDPOINT_URL for those. Then
+several app servers can work without a shared filesystem, and
+downloads redirect to presigned URLs, so the bytes do not go through
+the app. Credentials come from the usual boto3 sources.
+
+Existing files are copied to the bucket with "flask storage migrate".
+"""
+import os
+import os.path
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterator
+from urllib.parse import quote
+import click
+from flask.cli import with_appcontext
+from flask import Flask, current_app, redirect, request, send_file
+from werkzeug.utils import send_file as werkzeug_send_file
+from werkzeug.wrappers import Response
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+
+CHUNK_SIZE = 64 * 1024
+# Directories with stored files, relative to the instance directory.
+PREFIXES = ('packages/', 'plugins/', 'icons/', 'incoming/')
+
+
+class Storage(ABC):
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def save(self, key: str, f: BinaryIO):
+        """Stores the file, reading it from the current position."""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Returns a seekable file. Raises FileNotFoundError."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Deletes the file if it exists."""
+
+    @abstractmethod
+    def keys(self, prefix: str) -> Iterator[str]:
+        ...
+
+    def delete_prefix(self, prefix: str):
+        for key in list(self.keys(prefix)):
+            self.delete(key)
+
+    @abstractmethod
+    def send(self, key: str, **kwargs) -> Response:
+        """Returns a response with the file, or a redirect to it.
+        Arguments are passed to send_file()."""
+
+
+class LocalStorage(Storage):
+    """Files under the instance directory."""
+
+    def path(self, key: str) -> str:
+        return os.path.join(current_app.instance_path, *key.split('/'))
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def save(self, key: str, f: BinaryIO):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique names, since threads can save the same key at once.
+        with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(path), prefix='.tmp-',
+                delete=False) as out:
+            try:
+                shutil.copyfileobj(f, out, CHUNK_SIZE)
+            except BaseException:
+                out.close()
+                os.remove(out.name)
+                raise
+        os.chmod(out.name, 0o644)
+        os.replace(out.name, path)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), 'rb')
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, prefix: str) -> Iterator[str]:
+        root = current_app.instance_path
+        for path, _, files in os.walk(self.path(prefix)):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue
+                rel = os.path.relpath(os.path.join(path, name), root)
+                yield rel.replace(os.sep, '/')
+
+    def delete_prefix(self, prefix: str):
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+
+    def send(self, key: str, **kwargs) -> Response:
+        """With X_ACCEL_REDIRECT set to an internal nginx location that
+        maps to the instance directory, leaves sending the bytes to
+        nginx. For Apache or lighttpd, set USE_X_SENDFILE."""
+        path = self.path(key)
+        prefix = current_app.config['X_ACCEL_REDIRECT']
+        if not prefix:
+            return send_file(path, **kwargs)
+        resp = werkzeug_send_file(
+            path, request.environ, use_x_sendfile=True,
+            response_class=current_app.response_class,
+            max_age=current_app.get_send_file_max_age, **kwargs)
+        if 'X-Sendfile' in resp.headers:
+            del resp.headers['X-Sendfile']
+            resp.headers['X-Accel-Redirect'] = quote(
+                f'{prefix.rstrip("/")}/{key}')
+        return resp
+
+
+class _KeepOpen:
+    """Callers keep using files after saving, but boto3 closes them."""
+
+    def __init__(self, f: BinaryIO):
+        self._f = f
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def close(self):
+        pass
+
+
+class S3Storage(Storage):
+    def __init__(self, bucket: str, prefix: str = '',
+                 endpoint_url: str | None = None, region: str | None = None,
+                 expires: int = 300):
+        if boto3 is None:
+            raise RuntimeError('Please install boto3 to use S3 storage')
+        self.client = boto3.client(
+            's3', endpoint_url=endpoint_url or None,
+            region_name=region or None)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.expires = expires
+
+    def _name(self, key: str) -> str:
+        return f'{self.prefix}{key}'
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._name(key))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise
+        return True
+
+    def save(self, key: str, f: BinaryIO):
+        # Sends large files in parts, without reading them into memory.
+        self.client.upload_fileobj(
+            _KeepOpen(f), self.bucket, self._name(key))
+
+    def open(self, key: str) -> BinaryIO:
+        f = tempfile.TemporaryFile()
+        try:
+            self.client.download_fileobj(self.bucket, self._name(key), f)
+        except ClientError as e:
+            f.close()
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                raise FileNotFoundError(key)
+            raise
+        f.seek(0)
+        return f
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._name(key))
+
+    def keys(self, prefix: str) -> Iterator[str]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(
+                Bucket=self.bucket, Prefix=self._name(prefix)):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(self.prefix):]
+
+    def send(self, key: str, mimetype: str | None = None,
+             download_name: str | None = None, as_attachment: bool = False,
+             **kwargs) -> Response:
+        """Redirects to a presigned URL. ETags and ranges are handled
+        by the storage service."""
+        params = {'Bucket': self.bucket, 'Key': self._name(key)}
+        if mimetype:
+            params['ResponseContentType'] = mimetype
+        if download_name:
+            disposition = 'attachment' if as_attachment else 'inline'
+            params['ResponseContentDisposition'] = (
+                f'{disposition}; filename="{download_name}"')
+        url = self.client.generate_presigned_url(
+            'get_object', Params=params, ExpiresIn=self.expires)
+        return redirect(url)
+
+
+def make_storage(app: Flask) -> Storage:
+    kind = app.config['STORAGE']
+    if kind == 'local':
+        return LocalStorage()
+    if kind == 's3':
+        return S3Storage(
+            app.config['S3_BUCKET'], app.config['S3_PREFIX'],
+            app.config['S3_ENDPOINT_URL'], app.config['S3_REGION'],
+            app.config['DOWNLOAD_URL_EXPIRES'])
+    raise ValueError(f'Unknown STORAGE: {kind}')
+
+
+def get() -> Storage:
+    return current_app.extensions['storage']
+
+
+@click.group('storage')
+def storage_command():
+    """Manages stored files."""
+
+
+@storage_command.command('migrate')
+@with_appcontext
+@click.option('--delete', is_flag=True,
+              help='Delete local files after copying them.')
+def migrate_command(delete: bool):
+    """Copies files from the instance directory to the storage."""
+    target = get()
+    if isinstance(target, LocalStorage):
+        raise click.ClickException('The storage is already local.')
+    source = LocalStorage()
+    copied = skipped = 0
+    for prefix in PREFIXES:
+        for key in source.keys(prefix):
+            if target.exists(key):
+                skipped += 1
+            else:
+                with source.open(key) as f:
+                    target.save(key, f)
+                copied += 1
+            if delete:
+                source.delete(key)
+    click.echo(f'Copied {copied} files, {skipped} were already there.')
+
+
+def init_app(app: Flask):
+    app.extensions['storage'] = make_storage(app)
+    app.cli.add_command(storage_command)
@@ -0,0 +1,179 @@
+"""Generates a synthetic catalog for load testing.
+
+Creates the database schema with migrations and publishes N plugins
+with M versions each through the same code as the upload form, so the
+instance directory gets real packages, icons and thumbnails, and the
+search index is filled. Packages contain a plugin.yaml with a markdown
+description, a few data files and an icon.
+
+    python -m bench.catalog /tmp/bench --plugins 200 --versions 10
+    python -m bench.catalog /tmp/bench --database postgresql:///edpr_bench
+
+Then run bench.load with the same instance directory and database.
+"""
+import io
+import os
+import json
+import random
+import zipfile
+import argparse
+import yaml
+from datetime import datetime, timedelta
+from flask_migrate import upgrade
+from sqlalchemy import func
+from app import create_app, catalog, icons
+from app.database import (
+    db, User, Plugin, PluginVersion, latest_version_query,
+)
+from app.plugins import add_version
+
+
+MIGRATIONS = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'migrations')
+USERS = 20
+COUNTRIES = [None, None, None, 'DE', 'FR', 'GB', 'EE', 'US-HI']
+WORDS = (
+    'shop cafe bench tree bus stop entrance address building survey '
+    'playground crossing tactile paving bicycle parking toilets waste '
+    'basket drinking water fountain hydrant street lamp post box '
+    'defibrillator charging station surface smoothness opening hours'
+).split()
+
+
+def database_uri(instance: str, database: str | None) -> str:
+    return database or f'sqlite:///{instance}/bench.sqlite'
+
+
+def make_app(instance: str, database: str | None,
+             config: dict | None = None):
+    """Creates the app with its instance directory pointing to the
+    benchmark directory."""
+    os.makedirs(instance, exist_ok=True)
+    app = create_app({
+        'SECRET_KEY': 'bench',
+        'SQLALCHEMY_DATABASE_URI': database_uri(instance, database),
+        **(config or {}),
+    })
+    app.instance_path = instance
+    return app
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def make_icon(rng: random.Random) -> tuple[str, bytes]:
+    color = f'#{rng.randrange(0x1000000):06x}'
+    if icons.Image is not None and rng.random() < 0.5:
+        buf = io.BytesIO()
+        icons.Image.new('RGB', (256, 256), color).save(buf, 'PNG')
+        return 'png', buf.getvalue()
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24">'
+        f'<circle cx="12" cy="12" r="{rng.randint(4, 12)}" fill="{color}"/>'
+        '</svg>'
+    )
+    return 'svg', svg.encode()
+
+
+def make_package(rng: random.Random, plugin_id: str, title: str,
+                 version: int | str, country: str | None) -> bytes:
+    icon_ext, icon_data = make_icon(rng)
+    metadata = {
+        'id': plugin_id,
+        'name': title,
+        'version': version,
+        'description': '\n\n'.join(
+            sentence(rng, rng.randint(10, 40)) for _ in range(3)),
+        'experimental': rng.random() < 0.2,
+        'icon': f'icon.{icon_ext}',
+        'homepage': f'https://example.com/{plugin_id}',
+    }
+    if country:
+        metadata['country'] = country
+    features = [
+        {'type': 'Feature', 'properties': {'name': sentence(rng, 3)},
+         'geometry': {'type': 'Point', 'coordinates': [
+             round(rng.uniform(-180, 180), 6),
+             round(rng.uniform(-80, 80), 6)]}}
+        for _ in range(rng.randint(10, 2000))
+    ]
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('plugin.yaml', yaml.safe_dump(metadata, sort_keys=False))
+        z.writestr(f'icons/icon.{icon_ext}', icon_data)
+        z.writestr('data/points.geojson', json.dumps(
+            {'type': 'FeatureCollection', 'features': features}))
+        z.writestr('presets.yaml', '\n'.join(
+            f'{w}:\n  name: {sentence(rng, 2)}\n  tags: {{amenity: {w}}}'
+            for w in rng.sample(WORDS, 10)))
+    return buf.getvalue()
+
+
+def generate(plugins: int, versions: int, seed: int = 1):
+    rng = random.Random(seed)
+    db.session.execute(db.insert(User), [
+        {'osm_id': i, 'name': f'user{i}', 'token': f'bench-token-{i}'}
+        for i in range(1, USERS + 1)])
+    db.session.commit()
+    users = list(db.session.scalars(db.select(User)))
+
+    for i in range(plugins):
+        plugin_id = f'plugin-{i}'
+        title = f'{sentence(rng, 2)} {i}'
+        country = rng.choice(COUNTRIES)
+        user = rng.choice(users)
+        for v in range(1, versions + 1):
+            add_version(io.BytesIO(make_package(
+                rng, plugin_id, title, v, country)), user)
+
+    # Spread versions over the past two years and add some downloads.
+    start = datetime.now() - timedelta(days=730)
+    for vobj in db.session.scalars(db.select(PluginVersion)):
+        vobj.created_on = start + timedelta(
+            days=vobj.version * 30 + rng.randint(0, 29))
+        vobj.downloads = int(rng.paretovariate(1.2) * 10)
+    db.session.execute(db.update(Plugin).values(
+        last_version_pk=latest_version_query(
+            PluginVersion.pk, Plugin.id, stable=True),
+        last_eversion_pk=latest_version_query(
+            PluginVersion.pk, Plugin.id, stable=False),
+        updated_on=latest_version_query(
+            PluginVersion.created_on, Plugin.id, stable=False),
+        downloads=(
+            db.select(func.sum(PluginVersion.downloads))
+            .where(PluginVersion.plugin_id == Plugin.id)
+            .scalar_subquery()),
+    ))
+    db.session.commit()
+    catalog.invalidate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('instance', help='instance directory to fill')
+    parser.add_argument('--database', help='database URI, '
+                        'bench.sqlite in the instance directory by default')
+    parser.add_argument('--plugins', type=int, default=200)
+    parser.add_argument('--versions', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    options = parser.parse_args()
+
+    instance = os.path.abspath(options.instance)
+    app = make_app(instance, options.database)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        if db.session.scalar(db.select(func.count(Plugin.id))):
+            parser.error('The database already has plugins')
+        generate(options.plugins, options.versions, options.seed)
+        print(json.dumps({
+            'plugins': db.session.scalar(
+                db.select(func.count(Plugin.id))),
+            'versions': db.session.scalar(
+                db.select(func.count(PluginVersion.pk))),
+        }))
+
+
+if __name__ == '__main__':
+    main()
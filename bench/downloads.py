@@ -0,0 +1,115 @@
+"""Measures download throughput with concurrent worker processes.
+
+Runs the same number of downloads with per-download commits and with
+the write-behind counter (in memory and spooled), and checks that no
+increments were lost. Prints the results as JSON.
+
+    python -m bench.downloads --workers 8 --requests 500
+"""
+import io
+import sys
+import json
+import time
+import zipfile
+import argparse
+import tempfile
+import multiprocessing
+from app import create_app
+from app.database import db, User, Plugin, PluginVersion
+from app import downloads, storage
+
+
+MODES = {
+    'commit': {'DOWNLOAD_FLUSH_INTERVAL': 0},
+    'memory': {'DOWNLOAD_FLUSH_INTERVAL': 5, 'DOWNLOAD_SPOOL': False},
+    'spool': {'DOWNLOAD_FLUSH_INTERVAL': 5, 'DOWNLOAD_SPOOL': True},
+}
+
+
+def make_config(instance: str, mode: str) -> dict:
+    return {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{instance}/bench.sqlite',
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 60}},
+        **MODES[mode],
+    }
+
+
+def prepare(instance: str, mode: str):
+    app = create_app(make_config(instance, mode))
+    app.instance_path = instance
+    with app.app_context():
+        db.create_all()
+        user = User(osm_id=1, name='bench')
+        user.update_token()
+        plugin = Plugin(id='bench', title='Bench', description='',
+                        created_by=user)
+        version = PluginVersion(plugin=plugin, version=1, created_by=user,
+                                experimental=False)
+        db.session.add_all([user, plugin, version])
+        db.session.commit()
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as z:
+            z.writestr('plugin.yaml', 'id: bench\n')
+        buf.seek(0)
+        storage.get().save(version.file_key, buf)
+
+
+def worker(instance: str, mode: str, count: int, barrier):
+    app = create_app(make_config(instance, mode))
+    app.instance_path = instance
+    client = app.test_client()
+    barrier.wait()
+    for _ in range(count):
+        resp = client.get('/bench.v1.edp')
+        assert resp.status_code == 200, resp.status
+        resp.close()
+    downloads.flush()
+
+
+def run(mode: str, workers: int, count: int) -> dict:
+    with tempfile.TemporaryDirectory() as instance:
+        prepare(instance, mode)
+        barrier = multiprocessing.Barrier(workers + 1)
+        procs = [
+            multiprocessing.Process(
+                target=worker, args=(instance, mode, count, barrier))
+            for _ in range(workers)
+        ]
+        for p in procs:
+            p.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+        app = create_app(make_config(instance, mode))
+        with app.app_context():
+            counted = db.session.scalar(
+                db.select(PluginVersion.downloads))
+    total = workers * count
+    return {
+        'mode': mode,
+        'workers': workers,
+        'downloads': total,
+        'counted': counted,
+        'seconds': round(elapsed, 3),
+        'per_second': round(total / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Downloads per worker')
+    parser.add_argument('--mode', choices=list(MODES), action='append')
+    options = parser.parse_args()
+    results = [run(mode, options.workers, options.requests)
+               for mode in options.mode or MODES]
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
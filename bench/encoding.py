@@ -0,0 +1,80 @@
+"""Measures bytes on the wire and CPU time per /api/list request.
+
+Compares rebuilding and sending plain JSON on every request, which is
+what the endpoint used to do, with cached snapshots sent as is, gzipped
+and, when the brotli module is installed, brotli-compressed.
+Prints the results as JSON.
+
+    python -m bench.encoding --plugins 1000
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from app import create_app, catalog, encoding
+from app.database import db
+from bench.query_plans import fill
+
+
+MODES = {
+    'rebuild, plain': ({'CATALOG_TTL': 0, 'API_COMPRESSION': False}, None),
+    'cached, plain': ({'API_COMPRESSION': False}, None),
+    'cached, gzip': ({}, 'gzip'),
+    'cached, brotli': ({}, 'br'),
+}
+
+
+def run(instance: str, config: dict, accept: str | None,
+        requests: int) -> dict:
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{instance}/enc.sqlite',
+        **config,
+    })
+    app.instance_path = instance
+    with app.app_context():
+        catalog.invalidate()
+    client = app.test_client()
+    headers = {'Accept-Encoding': accept} if accept else {}
+
+    start = time.process_time()
+    first = client.get('/api/list', headers=headers)
+    first_cpu = time.process_time() - start
+
+    start = time.process_time()
+    for _ in range(requests):
+        resp = client.get('/api/list', headers=headers)
+    cpu = (time.process_time() - start) / requests
+    return {
+        'encoding': resp.headers.get('Content-Encoding', 'identity'),
+        'bytes': len(resp.data),
+        'first_request_ms': round(first_cpu * 1000, 2),
+        'cpu_ms_per_request': round(cpu * 1000, 3),
+        'same_as_first': first.data == resp.data,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--plugins', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=50)
+    options = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as instance:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{instance}/enc.sqlite',
+        })
+        with app.app_context():
+            db.create_all()
+            fill(options.plugins, 3)
+        for name, (config, accept) in MODES.items():
+            if accept == 'br' and encoding.brotli is None:
+                continue
+            results[name] = run(instance, config, accept, options.requests)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
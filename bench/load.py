@@ -0,0 +1,296 @@
+"""Measures throughput and latency of the main endpoints under load.
+
+Starts gunicorn serving a catalog made with bench.catalog, then for
+each endpoint runs concurrent clients for a fixed time and prints
+requests per second and latency percentiles as JSON, so that results
+can be compared between commits.
+
+    python -m bench.catalog /tmp/bench
+    python -m bench.load /tmp/bench --workers 4 --concurrency 16 > a.json
+
+With --url, it tests an already running server instead. Uploads need
+the server's SECRET_KEY to log in, and add plugins to the catalog.
+
+The clients are Python threads, so on a small machine they compete
+with the server for CPU. Compare numbers from the same machine only.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import statistics
+import subprocess
+import threading
+import http.client
+from urllib.parse import urlsplit
+from bench.catalog import make_app, make_package
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ('api_list', 'api_plugin', 'index', 'plugin', 'download',
+             'icon', 'upload')
+
+
+class Client:
+    """A keep-alive connection, with a session cookie if given."""
+
+    def __init__(self, url: str, session: str | None = None):
+        parts = urlsplit(url)
+        self.prefix = parts.path.rstrip('/')
+        self.conn = http.client.HTTPConnection(
+            parts.hostname or 'localhost', parts.port or 80, timeout=60)
+        self.session = session
+
+    def request(self, method: str, path: str, body: bytes | None = None,
+                headers: dict | None = None) -> tuple[int, bytes]:
+        headers = dict(headers or {})
+        if self.session:
+            headers['Cookie'] = f'session={self.session}'
+        try:
+            self.conn.request(method, self.prefix + path, body, headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            raise
+        cookie = resp.getheader('Set-Cookie') or ''
+        if m := re.match(r'session=([^;]*)', cookie):
+            self.session = m.group(1)
+        return resp.status, data
+
+
+class Uploader:
+    """Publishes new versions of a plugin owned by the client."""
+
+    def __init__(self, client: Client, rng: random.Random):
+        self.client = client
+        self.rng = rng
+        self.plugin_id = f'bench-{uuid.uuid4().hex[:12]}'
+        self.version = 0
+        status, data = client.request('GET', '/upload')
+        m = re.search(rb'name="csrf_token" type="hidden" value="([^"]+)"',
+                      data)
+        if status != 200 or not m:
+            raise RuntimeError(f'Could not open the upload form: {status}')
+        self.csrf_token = m.group(1)
+
+    def request(self) -> tuple[int, bytes]:
+        self.version += 1
+        # Versions like 1.5 go up to 1000 minor versions.
+        version = f'{self.version // 1000 + 1}.{self.version % 1000}'
+        package = make_package(
+            self.rng, self.plugin_id, self.plugin_id, version, None)
+        boundary = uuid.uuid4().hex
+        body = b''.join([
+            f'--{boundary}\r\n'
+            'Content-Disposition: form-data; name="csrf_token"\r\n\r\n'
+            .encode(), self.csrf_token, b'\r\n',
+            f'--{boundary}\r\n'
+            'Content-Disposition: form-data; name="package"; '
+            f'filename="{self.plugin_id}.edp"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'.encode(),
+            package, f'\r\n--{boundary}--\r\n'.encode(),
+        ])
+        status, data = self.client.request('POST', '/upload', body, {
+            'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        # The form is shown again with errors.
+        return (status if status != 200 else 422), data
+
+
+def make_request(name: str, targets: dict, rng: random.Random):
+    """Returns a function that makes one request to the endpoint with
+    a client."""
+    def plugin_id() -> str:
+        return rng.choice(targets['ids'])
+
+    paths = {
+        'api_list': lambda: '/api/list',
+        'api_plugin': lambda: f'/api/plugin/{plugin_id()}',
+        'index': lambda: '/',
+        'plugin': lambda: f'/{plugin_id()}',
+        'download': lambda: f'/{plugin_id()}.edp',
+        'icon': lambda: rng.choice(targets['icons']),
+    }
+
+    def get(client: Client, uploader: Uploader | None):
+        return client.request('GET', paths[name](), headers={
+            'Accept-Encoding': 'gzip'})
+
+    def upload(client: Client, uploader: Uploader | None):
+        assert uploader
+        return uploader.request()
+
+    return upload if name == 'upload' else get
+
+
+def run_endpoint(name: str, options, targets: dict,
+                 session: str | None) -> dict:
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    errors = 0
+    lock = threading.Lock()
+    start_at = time.monotonic() + options.warmup
+    stop_at = start_at + options.duration
+
+    def worker(n: int):
+        nonlocal errors
+        rng = random.Random(options.seed + n)
+        # Other endpoints are measured as anonymous visitors get them,
+        # with pages that shared caches can keep.
+        client = Client(options.url, session if name == 'upload' else None)
+        uploader = Uploader(client, rng) if name == 'upload' else None
+        do_request = make_request(name, targets, rng)
+        while (now := time.monotonic()) < stop_at:
+            try:
+                status, _ = do_request(client, uploader)
+            except (OSError, http.client.HTTPException):
+                status = 0
+            elapsed = time.monotonic() - now
+            if now < start_at:
+                continue
+            with lock:
+                if status and status < 400:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(n,))
+               for n in range(options.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    result: dict = {
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'rps': round(len(latencies) / options.duration, 1),
+    }
+    if len(latencies) >= 2:
+        q = statistics.quantiles(latencies, n=100, method='inclusive')
+        result['latency_ms'] = {
+            'mean': round(statistics.fmean(latencies) * 1000, 2),
+            'p50': round(q[49] * 1000, 2),
+            'p90': round(q[89] * 1000, 2),
+            'p99': round(q[98] * 1000, 2),
+            'max': round(max(latencies) * 1000, 2),
+        }
+    return result
+
+
+def find_targets(url: str) -> dict:
+    status, data = Client(url).request('GET', '/api/list?exp=1')
+    if status != 200:
+        raise RuntimeError(f'/api/list returned {status}')
+    plugins = json.loads(data)
+    if not plugins:
+        raise RuntimeError('The catalog is empty, run bench.catalog first')
+    prefix = urlsplit(url).path.rstrip('/')
+    return {
+        'ids': [p['id'] for p in plugins],
+        'icons': [urlsplit(p['icon']).path.removeprefix(prefix)
+                  for p in plugins if p.get('icon')],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(options) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = dict(os.environ, BENCH_INSTANCE=options.instance,
+               BENCH_DATABASE=options.database or '',
+               BENCH_CONFIG=options.config or '')
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', '--workers', str(options.workers),
+        '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+        'bench.wsgi:app',
+    ], cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('gunicorn exited')
+        try:
+            Client(url).request('GET', '/api/list')
+            return server, url
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start in 30 seconds')
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('instance', help='directory made by bench.catalog')
+    parser.add_argument('--database', help='database URI, '
+                        'bench.sqlite in the instance directory by default')
+    parser.add_argument('--config', help='JSON object with app settings')
+    parser.add_argument('--url', help='test a running server instead')
+    parser.add_argument('--secret-key', default='bench',
+                        help='SECRET_KEY of the server, for uploads')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--endpoint', action='append', choices=ENDPOINTS,
+                        help='endpoints to test, all by default')
+    options = parser.parse_args()
+    options.instance = os.path.abspath(options.instance)
+
+    # A session cookie for the first generated user.
+    app = make_app(options.instance, options.database, {
+        'SECRET_KEY': options.secret_key})
+    session = app.session_interface.get_signing_serializer(app).dumps(
+        {'user_id': 1})
+
+    server = None
+    if not options.url:
+        server, options.url = start_gunicorn(options)
+    try:
+        targets = find_targets(options.url)
+        results = {}
+        for name in options.endpoint or ENDPOINTS:
+            results[name] = run_endpoint(name, options, targets, session)
+            print(f'{name}: {results[name]["rps"]} rps', file=sys.stderr)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps({
+        'commit': git_commit(),
+        'settings': {
+            'workers': None if server is None else options.workers,
+            'concurrency': options.concurrency,
+            'duration': options.duration,
+            'database': options.database or 'sqlite',
+            'config': json.loads(options.config or '{}'),
+            'plugins': len(targets['ids']),
+        },
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
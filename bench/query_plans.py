@@ -0,0 +1,160 @@
+"""Checks that hot queries do not scan whole tables.
+
+Fills an SQLite database with a synthetic catalog and runs
+EXPLAIN QUERY PLAN for each query. Exits with an error when any of
+them does a full scan of a table that grows with uploads or over time.
+Listing plugins reads most of the plugin table anyway, so scanning it
+is allowed.
+
+    python -m bench.query_plans --plugins 10000 --versions 50
+"""
+import sys
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+from app import create_app
+from app.api import filter_visible
+from app.database import (
+    db, User, Plugin, PluginVersion, PluginChange, Job,
+    latest_version_query,
+)
+
+
+# Tables that must be searched with an index.
+LARGE_TABLES = ('plugin_version', 'plugin_change', 'job')
+
+
+def fill(plugins: int, versions: int):
+    db.session.execute(db.insert(User), [
+        {'osm_id': 1, 'name': 'bench', 'token': 'bench'}])
+    db.session.execute(db.insert(Plugin), [
+        {'id': f'p{i}', 'title': f'Plugin {i}', 'description': '',
+         'created_by_id': 1, 'hidden': i % 50 == 0,
+         'country': ['DE', 'FR', None, None][i % 4]}
+        for i in range(plugins)])
+    start = datetime(2025, 1, 1)
+    for i in range(plugins):
+        db.session.execute(db.insert(PluginVersion), [
+            {'plugin_id': f'p{i}', 'version': v + 1, 'created_by_id': 1,
+             'created_on': start + timedelta(days=v),
+             'experimental': v % 3 == 0, 'sha256': f'{i:032x}{v:032x}'}
+            for v in range(versions)])
+    db.session.execute(db.insert(PluginChange), [
+        {'plugin_id': f'p{i}'} for i in range(plugins)])
+    db.session.execute(db.insert(Job), [
+        {'kind': 'upload', 'payload': {}, 'status': 'done',
+         'plugin_id': f'p{i}', 'created_by_id': 1}
+        for i in range(plugins)])
+    db.session.execute(db.update(Plugin).values(
+        last_version_pk=latest_version_query(
+            PluginVersion.pk, Plugin.id, stable=True),
+        last_eversion_pk=latest_version_query(
+            PluginVersion.pk, Plugin.id, stable=False),
+        updated_on=latest_version_query(
+            PluginVersion.created_on, Plugin.id, stable=False),
+    ))
+    db.session.commit()
+
+
+def queries() -> dict:
+    return {
+        'latest stable version': db.select(latest_version_query(
+            PluginVersion.pk, 'p1', stable=True)),
+        'latest version': db.select(latest_version_query(
+            PluginVersion.pk, 'p1', stable=False)),
+        'update stats': (
+            db.update(Plugin).where(Plugin.id == 'p1').values(
+                last_version_pk=latest_version_query(
+                    PluginVersion.pk, 'p1', stable=True),
+                last_eversion_pk=latest_version_query(
+                    PluginVersion.pk, 'p1', stable=False),
+                updated_on=latest_version_query(
+                    PluginVersion.created_on, 'p1', stable=False),
+            )),
+        'latest versions for a list': (
+            db.select(PluginVersion)
+            .where(PluginVersion.pk.in_([1, 51, 101]))),
+        'versions of a plugin': (
+            db.select(PluginVersion).where(PluginVersion.plugin_id == 'p1')
+            .order_by(PluginVersion.created_on.desc())),
+        'version by number': (
+            db.select(PluginVersion)
+            .where(PluginVersion.plugin_id == 'p1')
+            .where(PluginVersion.version == 5)
+            .limit(1)),
+        'upload version check': (
+            db.select(func.count(PluginVersion.pk))
+            .where(PluginVersion.plugin_id == 'p1')
+            .where(PluginVersion.version >= 5)),
+        'stored package users': (
+            db.select(func.count(PluginVersion.pk))
+            .where(PluginVersion.sha256 == f'{1:032x}{5:032x}')),
+        'stored installed versions': (
+            db.select(PluginVersion.plugin_id, PluginVersion.version)
+            .where(PluginVersion.plugin_id.in_(['p1', 'p2', 'p3']))
+            .where(PluginVersion.version.in_([1, 5, 7]))
+            .where(PluginVersion.sha256.is_not(None))),
+        'visible plugins': (
+            filter_visible(db.select(Plugin), [])
+            .where(Plugin.last_version_pk.is_not(None))
+            .order_by(Plugin.title)),
+        'visible plugins for countries': (
+            filter_visible(db.select(Plugin), ['DE'])
+            .where(Plugin.last_version_pk.is_not(None))
+            .order_by(Plugin.title)),
+        'changed plugins': (
+            db.select(PluginChange.plugin_id).distinct()
+            .where(PluginChange.seq > 100)
+            .where(PluginChange.seq <= 110)),
+        'change feed token': db.select(func.max(PluginChange.seq)),
+        'plugin revision': (
+            db.select(func.max(PluginChange.seq))
+            .where(PluginChange.plugin_id == 'p1')),
+        'next queued job': (
+            db.select(Job.id).where(Job.status == 'queued')
+            .order_by(Job.id).limit(1)),
+        'uploads of a plugin': (
+            db.select(Job)
+            .where(Job.plugin_id == 'p1', Job.kind == 'upload',
+                   Job.status != 'done')
+            .order_by(Job.id.desc()).limit(5)),
+    }
+
+
+def explain(stmt) -> list[str]:
+    sql = stmt.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))
+    return [row[-1] for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--plugins', type=int, default=10000)
+    parser.add_argument('--versions', type=int, default=50)
+    options = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as instance:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{instance}/plans.sqlite',
+        })
+        with app.app_context():
+            db.create_all()
+            fill(options.plugins, options.versions)
+            db.session.execute(text('ANALYZE'))
+            for name, stmt in queries().items():
+                plan = explain(stmt)
+                scans = [p for p in plan
+                         if p.split(' ')[:2] in (
+                             ['SCAN', t] for t in LARGE_TABLES)]
+                status = 'FAIL' if scans else 'ok'
+                failed = failed or bool(scans)
+                print(f'{status:4} {name}')
+                for line in plan:
+                    print(f'       {line}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
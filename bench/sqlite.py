@@ -0,0 +1,127 @@
+"""Measures lock contention on SQLite with concurrent worker processes.
+
+Each process serves a mix of page views and downloads, which commit
+the download counter right away, for a fixed time. Runs once with
+stock SQLite settings and once with SQLITE_PRODUCTION, and prints
+throughput, latency percentiles and the number of "database is
+locked" failures as JSON.
+
+    python -m bench.sqlite --workers 8 --duration 10
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import tempfile
+import multiprocessing
+from flask_migrate import upgrade
+from app.database import db
+from bench.catalog import MIGRATIONS, make_app, generate
+
+
+MODES = {
+    'stock': {'SQLITE_PRODUCTION': False},
+    'production': {'SQLITE_PRODUCTION': True},
+}
+PAGES = ['/', '/api/list', '/api/plugin/{}', '/{}']
+
+
+def make_config(mode: str) -> dict:
+    return {
+        # Count every download, to have many small write transactions.
+        'DOWNLOAD_FLUSH_INTERVAL': 0,
+        'CATALOG_TTL': 0,
+        # Raise errors instead of returning 500, to tell them apart.
+        'PROPAGATE_EXCEPTIONS': True,
+        **MODES[mode],
+    }
+
+
+def worker(instance: str, mode: str, duration: float, writes: float,
+           seed: int, barrier, results):
+    app = make_app(instance, None, make_config(mode))
+    client = app.test_client()
+    rng = random.Random(seed)
+    ids = [f'plugin-{i}' for i in range(20)]
+    latencies: list[float] = []
+    locked = errors = 0
+    barrier.wait()
+    stop_at = time.monotonic() + duration
+    while (start := time.monotonic()) < stop_at:
+        plugin_id = rng.choice(ids)
+        if rng.random() < writes:
+            url = f'/{plugin_id}.edp'
+        else:
+            url = rng.choice(PAGES).format(plugin_id)
+        try:
+            resp = client.get(url)
+            resp.close()
+            if resp.status_code != 200:
+                errors += 1
+                continue
+        except Exception as e:
+            if 'database is locked' in str(e):
+                locked += 1
+            else:
+                errors += 1
+            with app.app_context():
+                db.session.remove()
+            continue
+        latencies.append(time.monotonic() - start)
+    results.put((latencies, locked, errors))
+
+
+def run(mode: str, workers: int, duration: float, writes: float) -> dict:
+    with tempfile.TemporaryDirectory() as instance:
+        app = make_app(instance, None, make_config(mode))
+        with app.app_context():
+            upgrade(directory=MIGRATIONS)
+            generate(20, 3)
+
+        barrier = multiprocessing.Barrier(workers)
+        results: multiprocessing.Queue[tuple[list[float], int, int]] = (
+            multiprocessing.Queue())
+        procs = [
+            multiprocessing.Process(target=worker, args=(
+                instance, mode, duration, writes, n, barrier, results))
+            for n in range(workers)
+        ]
+        for p in procs:
+            p.start()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+    latencies = [t for r in collected for t in r[0]]
+    q = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'mode': mode,
+        'workers': workers,
+        'requests': len(latencies),
+        'per_second': round(len(latencies) / duration, 1),
+        'locked': sum(r[1] for r in collected),
+        'errors': sum(r[2] for r in collected),
+        'p50_ms': round(q[49] * 1000, 2),
+        'p99_ms': round(q[98] * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--writes', type=float, default=0.3,
+                        help='Share of requests that are downloads')
+    parser.add_argument('--mode', choices=list(MODES), action='append')
+    options = parser.parse_args()
+    results = [run(mode, options.workers, options.duration, options.writes)
+               for mode in options.mode or MODES]
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Checks the S3 storage backend against a local S3 stand-in.
+
+Publishes a small synthetic catalog with local storage, copies it to
+a bucket with "flask storage migrate", and then stores, sends and
+deletes files through the S3 backend. Without --endpoint, starts
+moto's server in the process (pip install 'moto[server]'). Prints the
+results as JSON and exits with an error if any check fails.
+
+    python -m bench.storage
+    python -m bench.storage --endpoint http://localhost:9000 --bucket test
+"""
+import io
+import os
+import sys
+import json
+import argparse
+import tempfile
+import urllib.request
+from flask_migrate import upgrade
+from app import storage
+from app.database import db, PluginVersion
+from bench.catalog import MIGRATIONS, make_app, generate
+
+
+def fetch(url: str) -> tuple[bytes, str | None]:
+    with urllib.request.urlopen(url) as resp:
+        return resp.read(), resp.headers.get('Content-Disposition')
+
+
+def check(instance: str, endpoint: str, bucket: str) -> dict:
+    results: dict = {}
+    app = make_app(instance, None)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        generate(3, 2)
+        local_keys: set[str] = set()
+        for prefix in storage.PREFIXES:
+            local_keys.update(storage.get().keys(prefix))
+
+    s3_config = {
+        'STORAGE': 's3',
+        'S3_BUCKET': bucket,
+        'S3_PREFIX': 'bench/',
+        'S3_ENDPOINT_URL': endpoint,
+        # Nothing left to flush after the directory is removed.
+        'DOWNLOAD_FLUSH_INTERVAL': 0,
+    }
+    app = make_app(instance, None, s3_config)
+    s3 = app.extensions['storage']
+    s3.client.create_bucket(Bucket=bucket)
+    runner = app.test_cli_runner()
+
+    output = runner.invoke(args=['storage', 'migrate']).output.strip()
+    with app.app_context():
+        migrated = set(s3.keys(''))
+    results['migrate'] = output
+    results['migrated all files'] = migrated == local_keys
+    output = runner.invoke(args=['storage', 'migrate']).output.strip()
+    results['migrate again copies nothing'] = output.startswith('Copied 0')
+
+    with app.test_request_context():
+        data = os.urandom(300 * 1024)
+        s3.save('bench/file.bin', io.BytesIO(data))
+        results['store'] = s3.exists('bench/file.bin')
+        with s3.open('bench/file.bin') as f:
+            results['open'] = f.read() == data
+        resp = s3.send('bench/file.bin', download_name='file.bin',
+                       as_attachment=True)
+        body, disposition = fetch(resp.location)
+        results['send'] = (resp.status_code == 302 and body == data and
+                           disposition == 'attachment; filename="file.bin"')
+        s3.delete('bench/file.bin')
+        s3.delete('bench/file.bin')
+        results['delete'] = not s3.exists('bench/file.bin')
+        try:
+            s3.open('bench/file.bin')
+            results['open missing'] = False
+        except FileNotFoundError:
+            results['open missing'] = True
+
+    client = app.test_client()
+    with app.app_context():
+        vobj = db.session.scalars(db.select(PluginVersion).limit(1)).one()
+        name, version, key = vobj.plugin_id, vobj.version_str, vobj.file_key
+        with open(os.path.join(instance, key), 'rb') as f:
+            package = f.read()
+    resp = client.get(f'/{name}.v{version}.edp')
+    body, _ = fetch(resp.location)
+    results['download redirect'] = resp.status_code == 302
+    results['download bytes'] = body == package
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--endpoint', help='S3 endpoint URL, '
+                        'starts moto by default')
+    parser.add_argument('--bucket', default='edpr-bench')
+    options = parser.parse_args()
+
+    server = None
+    endpoint = options.endpoint
+    if not endpoint:
+        from moto.server import ThreadedMotoServer
+        for k in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+            os.environ.setdefault(k, 'bench')
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        server = ThreadedMotoServer(port=0, verbose=False)
+        server.start()
+        host, port = server.get_host_and_port()
+        endpoint = f'http://{host}:{port}'
+    try:
+        with tempfile.TemporaryDirectory() as instance:
+            results = check(instance, endpoint, options.bucket)
+    finally:
+        if server:
+            server.stop()
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    if not all(v for k, v in results.items() if k != 'migrate'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Compares package validation with ZipFile.testzip() and check_members().
+
+Builds regular and adversarial packages in memory and reports validation
+time and peak allocated memory for both. Prints the results as JSON.
+
+    python -m bench.validate
+"""
+import io
+import sys
+import random
+import json
+import time
+import zipfile
+import tracemalloc
+from wtforms.validators import ValidationError
+from app.plugins import check_members
+
+
+LIMITS = {
+    'max_file': 50 * 1024 * 1024,
+    'max_total': 100 * 1024 * 1024,
+    'max_ratio': 100,
+}
+
+
+def regular(files: int, size: int) -> bytes:
+    """A package of poorly compressible files, like images."""
+    buf = io.BytesIO()
+    rnd = random.Random(files)
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('plugin.yaml', 'id: bench\nname: Bench\nversion: 1\n')
+        for i in range(files):
+            z.writestr(f'data/{i}.bin', rnd.randbytes(size))
+    return buf.getvalue()
+
+
+def bomb(size_mb: int) -> bytes:
+    """One file of zeroes, compressing roughly a thousand times."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        with z.open('zeroes.bin', 'w', force_zip64=True) as f:
+            block = b'\0' * (1024 * 1024)
+            for _ in range(size_mb):
+                f.write(block)
+    return buf.getvalue()
+
+
+def many_bombs(files: int, size_mb: int) -> bytes:
+    """Many files, each under the per-file ratio cap."""
+    buf = io.BytesIO()
+    size = size_mb * 1024 * 1024
+    data = random.Random(size).randbytes(size // 50)
+    data += b'\0' * (size - len(data))
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        for i in range(files):
+            z.writestr(f'{i}.bin', data)
+    return buf.getvalue()
+
+
+def corrupted() -> bytes:
+    data = bytearray(regular(20, 256 * 1024))
+    data[len(data) // 2] ^= 0xFF
+    return bytes(data)
+
+
+def measure(data: bytes, func) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as pkg:
+            result = func(pkg)
+            outcome = f'bad member: {result}' if result else 'ok'
+    except (ValidationError, zipfile.BadZipFile) as e:
+        outcome = f'rejected: {e}'
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'seconds': round(elapsed, 4),
+        'peak_kb': peak // 1024,
+        'outcome': outcome[:100],
+    }
+
+
+def main():
+    packages = {
+        'regular 200 x 100 KB': regular(200, 100 * 1024),
+        'regular 10 x 5 MB': regular(10, 5 * 1024 * 1024),
+        'bomb 1 GB': bomb(1024),
+        'bombs 40 x 10 MB': many_bombs(40, 10),
+        'corrupted': corrupted(),
+    }
+    results = []
+    for name, data in packages.items():
+        results.append({
+            'package': name,
+            'compressed_kb': len(data) // 1024,
+            'testzip': measure(data, lambda pkg: pkg.testzip()),
+            'check_members': measure(
+                data, lambda pkg: check_members(pkg, **LIMITS)),
+        })
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""WSGI entry point for bench.load, serving a generated catalog.
+
+    BENCH_INSTANCE=/tmp/bench gunicorn bench.wsgi:app
+
+BENCH_DATABASE overrides the database URI, and BENCH_CONFIG can hold
+a JSON object with more configuration, to compare settings.
+"""
+import os
+import json
+from bench.catalog import make_app
+
+
+app = make_app(
+    os.environ['BENCH_INSTANCE'],
+    os.environ.get('BENCH_DATABASE'),
+    json.loads(os.environ.get('BENCH_CONFIG') or '{}'),
+)
@@ -0,0 +1,61 @@
+"""search index
+
+Revision ID: 9d1c4e5b7a21
+Revises: 633265d8115e
+Create Date: 2026-10-17 01:49:02.118354
+
+Creates the plugin_search full-text index: an FTS5 table on SQLite,
+or a table with a tsvector column on PostgreSQL. See app/search.py.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9d1c4e5b7a21'
+down_revision = '633265d8115e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE plugin_search USING fts5("
+            "plugin_id UNINDEXED, title, description, author, changelogs, "
+            "tokenize='unicode61 remove_diacritics 2')")
+        op.execute(
+            "INSERT INTO plugin_search "
+            "SELECT p.id, p.title, p.description, u.name, "
+            "(SELECT group_concat(v.changelog, char(10)) "
+            " FROM plugin_version v WHERE v.plugin_id = p.id) "
+            "FROM plugin p JOIN user u ON u.osm_id = p.created_by_id")
+    elif dialect == 'postgresql':
+        op.create_table(
+            'plugin_search',
+            sa.Column('plugin_id', sa.String(), nullable=False),
+            sa.Column('document', postgresql.TSVECTOR(),
+                      nullable=False),
+            sa.ForeignKeyConstraint(['plugin_id'], ['plugin.id'],
+                                    ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('plugin_id'),
+        )
+        op.create_index('ix_plugin_search_document', 'plugin_search',
+                        ['document'], postgresql_using='gin')
+        op.execute(
+            "INSERT INTO plugin_search "
+            "SELECT p.id, "
+            "setweight(to_tsvector('simple', p.title), 'A') || "
+            "setweight(to_tsvector('simple', p.description), 'B') || "
+            "setweight(to_tsvector('simple', u.name), 'C') || "
+            "setweight(to_tsvector('simple', coalesce("
+            " (SELECT string_agg(v.changelog, E'\\n') FROM plugin_version v"
+            "  WHERE v.plugin_id = p.id), '')), 'D') "
+            "FROM plugin p JOIN \"user\" u ON u.osm_id = p.created_by_id")
+
+
+def downgrade():
+    if op.get_bind().dialect.name in ('sqlite', 'postgresql'):
+        op.drop_table('plugin_search')